@@ -15,9 +15,17 @@ app.use(express.json())
 
 app.disable('x-powered-by')
 
-async function executePythonProcess() {
-  const child = spawn('python', ['./py/init.py'])
-  console.info('Executing python process...')
+const {
+  CRAWL_RESUME_ATTEMPTS: resumeAttempts = 3,
+  CRAWL_RESUME_DELAY: resumeDelay = 10 * 60 * 1000
+} = process.env
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+async function executePythonProcess(args = []) {
+  const child = spawn('python', ['./py/init.py', ...args])
+  console.info('Executing python process...', ...args)
+  const exited = new Promise((resolve) => child.on('close', resolve))
 
   child.stdout.pipe(process.stdout)
 
@@ -27,17 +35,25 @@ async function executePythonProcess() {
     err += chunk
   }
 
-  child.on('close', (code) => {
-    console.log(`child process exited with code ${code}`)
-  })
+  const code = await exited
+  console.log(`child process exited with code ${code}`)
 
-  // return error messages to caller
-  return err
+  // return exit code and error messages to caller
+  return { code, err }
 }
 
 // Execute python process on Sundays at 3 AM
 schedule.scheduleJob({ hour: 3, minute: 0, dayOfWeek: 0 }, catchErrors(async() => {
-  const err = await executePythonProcess()
+  let result = await executePythonProcess()
+
+  // continue a failed crawl where it stopped instead of starting over,
+  // waiting longer before each attempt
+  for (let attempt = 0; result.code !== 0 && attempt < Number(resumeAttempts); attempt++) {
+    await sleep(Number(resumeDelay) * 2 ** attempt)
+    result = await executePythonProcess(['--resume'])
+  }
+
+  const { err } = result
   if (err) {
     console.error(err)
     await sendMail(err)
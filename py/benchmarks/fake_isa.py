@@ -0,0 +1,148 @@
+"""
+Scrapes the registrations from a local fake ISA server instead of isa.epfl.ch
+and checks the result: one report answers too slowly the first time and is retried,
+one fails with a server error once and is retried, and one is missing (404)
+and is recorded as failed without stopping the crawl.
+The reports are written to data/benchmark/registrations.jsonl.
+
+Usage: python benchmarks/fake_isa.py [courses] [port]
+"""
+import os
+import sys
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+num_courses = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+
+# the scraper reads its settings at import
+os.environ.update({
+    'ISA_BASE_URL': f'http://127.0.0.1:{port}/imoniteur_ISAP/',
+    'GASPAR_NAME': 'fake',
+    'GASPAR_PASS': 'fake',
+    'SCRAPER_READ_TIMEOUT': '0.5',
+    'SCRAPER_MAX_RETRIES': '1',
+    'SCRAPER_BACKOFF_BASE': '0',
+    'SCRAPER_RATE_PER_HOST': '1000'
+})
+
+from scraper.module import registrations
+from utils import read
+
+courses = [(str(1000 + i), f'Course {i % 7}') for i in range(num_courses)]
+slow_course, error_course, missing_course = '1005', '1006', '1007'
+session_cookie = 'session=fake'
+joint_program = 'Management, Technology and Entrepreneurship'
+# number of requests of each course report
+hits = {}
+
+
+def report_rows(x_MAT):
+    """
+    Rows of the report of the course @x_MAT: one program alone, then two programs together
+    (the second one with ', ' in its name)
+    """
+    i = int(x_MAT) - 1000
+    return [
+        (f'Program {i % 3}, 2020-2021, Master semester 1', f'{i} ét.'),
+        (
+            f'{registrations.epfl_prefix}Program {i % 5}, 2019-2020, Bachelor semester 3\n'
+            f'{joint_program} {i % 4}, 2019-2020, Master semester 1',
+            f'{i + 1} ét.'
+        )
+    ]
+
+
+def expected_registrations(x_MAT):
+    """Registrations of the course @x_MAT by year and programs, and the (program, semesters) pairs of each count"""
+    i = int(x_MAT) - 1000
+    reg = {
+        '2020-2021': {f'Program {i % 3}, Master semester 1': i},
+        '2019-2020': {
+            f'Program {i % 5}, Bachelor semester 3\n{joint_program} {i % 4}, Master semester 1': i + 1
+        }
+    }
+    programs_reg = {
+        '2020-2021': {key: [[f'Program {i % 3}', 'Master semester 1']] for key in reg['2020-2021']},
+        '2019-2020': {
+            key: [[f'Program {i % 5}', 'Bachelor semester 3'], [f'{joint_program} {i % 4}', 'Master semester 1']]
+            for key in reg['2019-2020']
+        }
+    }
+    return reg, programs_reg
+
+
+class FakeISA(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+    def send(self, status, html='', cookie=None):
+        body = html.encode()
+        self.send_response(status)
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # login
+        self.form()
+        self.send(200, 'ok', session_cookie)
+
+    def do_GET(self):
+        form = self.form()
+        if session_cookie not in (self.headers.get('Cookie') or ''):
+            return self.send(403)
+        if self.path.endswith(registrations.ISA_REPORTS_INSCRIPTIONS_COURS):
+            links = ''.join(
+                f'<a class="ww_x_MAT" onclick="{"x" * 32}{x_MAT}{"y" * 42}">{name}</a>' for x_MAT, name in courses
+            )
+            return self.send(200, f'<html>{links}</html>')
+
+        x_MAT = form.get('ww_x_MAT', '')
+        hits[x_MAT] = hits.get(x_MAT, 0) + 1
+        if x_MAT == missing_course:
+            return self.send(404)
+        if x_MAT == error_course and hits[x_MAT] == 1:
+            return self.send(500)
+        if x_MAT == slow_course and hits[x_MAT] == 1:
+            time.sleep(1.5)
+
+        rows = ''.join(
+            ''.join(f'<tr><td colspan="2">{program}</td></tr>' for program in programs.split('\n'))
+            + f'<tr><td colspan="2">{count}</td></tr>'
+            for programs, count in report_rows(x_MAT)
+        )
+        self.send(200, f'<html><table>{rows}</table></html>')
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeISA)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    start = time.perf_counter()
+    registrations_data = registrations.scrape(workers=4, subdir='benchmark')
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    records = {record['id']: record for record in read.iter_jsonl('registrations', 'benchmark')}
+    scraped = [x_MAT for x_MAT, _ in courses if x_MAT != missing_course]
+    assert sorted(records) == scraped, f'missing reports: {sorted(set(scraped) - set(records))}'
+    for x_MAT in scraped:
+        reg, programs_reg = expected_registrations(x_MAT)
+        assert records[x_MAT]['registrations'] == reg, f'report {x_MAT} differs'
+        assert records[x_MAT]['programs'] == programs_reg, f'programs of report {x_MAT} differ'
+    assert hits[slow_course] == 2 and hits[error_course] == 2 and hits[missing_course] == 1, hits
+    expected = {}
+    for x_MAT, name in courses:
+        if x_MAT != missing_course:
+            registrations.merge_registrations(expected, name, expected_registrations(x_MAT)[0])
+    assert registrations_data == expected, 'merged registrations differ'
+    print(f'{len(records)} of {len(courses)} course reports scraped in {elapsed:.2f} s, {sum(hits.values())} requests')
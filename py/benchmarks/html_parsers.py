@@ -0,0 +1,101 @@
+"""
+Parses the saved pages of benchmarks/fixtures with each HTML parser backend and checks
+that every field matches the former studyplan extractor (one find() per column) with 'html.parser'.
+Then replays a crawl from the page cache with each backend,
+times it and checks that every field matches the output of 'html.parser'.
+Run a crawl first (python init.py) to fill the cache.
+
+Usage: python benchmarks/html_parsers.py [parser ...] (default: html.parser lxml)
+"""
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+from scraper import scraper
+from scraper.module import cache, const, studyplan, coursebook
+from utils import read
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def field_differences(reference, other, path=''):
+    """Yields the paths of the fields where @other differs from @reference"""
+    if isinstance(reference, dict) and isinstance(other, dict):
+        for key in reference.keys() | other.keys():
+            yield from field_differences(reference.get(key), other.get(key), f'{path}.{key}')
+    elif isinstance(reference, list) and isinstance(other, list) and len(reference) == len(other):
+        for i, (a, b) in enumerate(zip(reference, other)):
+            yield from field_differences(a, b, f'{path}[{i}]')
+    elif reference != other:
+        yield path
+
+
+def line_columns_find(line):
+    """Tags of the columns of the studyplan @line, searched with one find() per column class"""
+    columns = {cls: line.find(class_=cls) for cls in studyplan.line_columns if cls != 'langue'}
+    language_column = line.find(class_='langue')
+    columns['langue'] = language_column.find(class_='langue') if language_column else None
+    return {cls: tag for cls, tag in columns.items() if tag is not None}
+
+
+def parse_fixtures():
+    """Fields scraped from each fixture page, by file name (studyplan-<level>-<program>.html or coursebook-*.html)"""
+    output = {}
+    for filename in sorted(os.listdir(fixtures_dir)):
+        with open(os.path.join(fixtures_dir, filename), encoding='utf-8') as file:
+            page = file.read()
+        with redirect_stdout(io.StringIO()):
+            if filename.startswith('studyplan-'):
+                level, slug = filename[len('studyplan-'):-len('.html')].split('-', maxsplit=1)
+                program = {
+                    'sourceSlug': slug, 'slug': slug, 'title': slug,
+                    'levelSourceSlug': level, 'levelSlug': level, 'levelTitle': level
+                }
+                output[filename] = studyplan.parse(page, program)
+            else:
+                output[filename] = coursebook.parse_page(page)
+    return output
+
+
+def check_fixtures(parsers):
+    line_columns_dict = studyplan.line_columns_dict
+    const.html_parser = 'html.parser'
+    studyplan.line_columns_dict = line_columns_find
+    reference = parse_fixtures()
+    studyplan.line_columns_dict = line_columns_dict
+
+    for parser in parsers:
+        const.html_parser = parser
+        differences = list(field_differences(reference, parse_fixtures()))
+        print(f'{parser}: {len(differences)} fields of the {len(reference)} fixture pages differ from the former extractor')
+        for path in differences[:20]:
+            print(f'  {path}')
+
+
+if __name__ == '__main__':
+    parsers = sys.argv[1:] or ['html.parser', 'lxml']
+    check_fixtures(parsers)
+    if not os.path.isdir(cache.cache_dir):
+        sys.exit('No cached pages to replay, run a crawl first')
+    const.offline = True
+
+    reference = None
+    for parser in ['html.parser'] + [p for p in parsers if p != 'html.parser']:
+        const.html_parser = parser
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            scraper.scrape(subdir='benchmark')
+        elapsed = time.perf_counter() - start
+        output = [read.read_jsonl(filename, 'benchmark') for filename in scraper.output_files]
+
+        if reference is None:
+            reference = output
+            print(f'{parser}: {elapsed:.2f} s')
+            continue
+
+        differences = list(field_differences(reference, output))
+        print(f'{parser}: {elapsed:.2f} s, {len(differences)} fields differ from html.parser')
+        for path in differences[:20]:
+            print(f'  {path}')
@@ -0,0 +1,168 @@
+"""
+Compares the dictionary-based ISA registration report parser with the former
+list-based parser on small fixture reports and on a large synthetic report,
+checks that both produce identical registrations and prints their throughput.
+
+Usage: python benchmarks/registrations_parser.py [programs] [repeat]
+(number of programs of the synthetic report, default 2000)
+"""
+import sys
+import time
+import random
+
+from bs4 import BeautifulSoup as bsoup
+
+from scraper.module import registrations
+from scraper.module.registrations import regex_years_end, regex_number, epfl_prefix
+
+# (rows, expected registrations), a row is a program/year/semester or a count ('ét.')
+fixtures = [
+    (
+        ['Bioengineering, 2019-2020, Master semester 1', '12 ét.'],
+        {'2019-2020': {'Bioengineering, Master semester 1': 12}}
+    ),
+    (
+        # several semesters of the same program, appended or prepended in increasing order
+        [
+            'Bioengineering, 2019-2020, Master semester 3',
+            'Bioengineering, 2019-2020, Master semester 1',
+            'Life Sciences Engineering, 2019-2020, Master semester 2',
+            'Bioengineering, 2019-2020, Master semester 5',
+            '7 ét.'
+        ],
+        {'2019-2020': {
+            'Bioengineering, Master semester 1, 3, 5\nLife Sciences Engineering, Master semester 2': 7
+        }}
+    ),
+    (
+        # edoc without semester, epfl prefix and semesters that are not numbers
+        [
+            'Ecole polytechnique fédérale de Lausanne, EDOC Physics, 2020-2021',
+            '3 ét.',
+            'Mineur en Energie, 2020-2021, Semestre automne',
+            'Mineur en Energie, 2020-2021, Semestre printemps',
+            '1 ét.'
+        ],
+        {'2020-2021': {'EDOC Physics': 3, 'Mineur en Energie, Semestre automne, printemps': 1}}
+    )
+]
+
+
+def process_course_registration_report_lists(reg, soup):
+    """
+    Adds the counts of the report @soup to @reg, looking up each program
+    in a list of the programs read since the last count
+    """
+    colspan_2 = soup.select('tr > td[colspan="2"]')
+
+    programs = []
+    semesters = []
+
+    for el in colspan_2:
+        text = el.text
+
+        if 'ét.' not in text:
+            text = text.replace(epfl_prefix, '')
+
+            if regex_years_end.match(text):
+                text_split = text.rsplit(', ', maxsplit=1)
+                program = text_split[0]
+                year = text_split[1]
+                semester = ''
+            else:
+                text_split = text.rsplit(', ', maxsplit=2)
+                program = text_split[0]
+                year = text_split[1]
+                semester = text_split[2]
+
+            if year not in reg:
+                reg[year] = {}
+
+            if program in programs:
+                idx = programs.index(program)
+                if semesters[idx] == semester:
+                    continue
+
+                sem = semester.rsplit(maxsplit=1)[1]
+                oldsem = semesters[idx].rsplit(maxsplit=1)[1]
+
+                try:
+                    if int(sem) > int(oldsem):
+                        semesters[idx] += (', ' + sem)
+                    else:
+                        semesters[idx] = semesters[idx][:-1]
+                        semesters[idx] += (sem + ', ' + oldsem)
+                except ValueError:
+                    semesters[idx] += (', ' + sem)
+
+            else:
+                programs.append(program)
+                semesters.append(semester)
+
+        else:
+            programs_key = '\n'.join(
+                list(map(
+                    lambda tup: tup[0]+', '+tup[1] if tup[1] else tup[0],
+                    zip(programs, semesters)
+                ))
+            )
+            reg[year][programs_key] = int(regex_number.search(text)[0])
+            programs = []
+            semesters = []
+
+
+def report_html(rows):
+    """ISA report page with one table row per @rows"""
+    cells = ''.join(f'<tr><td colspan="2">{row}</td><td>-</td></tr>' for row in rows)
+    return f'<html><body><table><tr><th colspan="2">Inscriptions</th></tr>{cells}</table></body></html>'
+
+
+def synthetic_rows(num_programs, seed=0):
+    """Rows of a report listing all @num_programs programs together, then in small groups"""
+    rng = random.Random(seed)
+    programs = [f'Program {i}' for i in range(num_programs)]
+    rows = []
+    for year in ('2019-2020', '2020-2021'):
+        # one count over all programs (the case that was quadratic), with repeated programs
+        for program in programs + rng.sample(programs, num_programs // 2):
+            rows.append(f'{program}, {year}, Master semester {rng.randint(1, 4)}')
+        rows.append(f'{rng.randint(1, 500)} ét.')
+        for start in range(0, num_programs, 5):
+            for program in programs[start:start + 5]:
+                if rng.random() < 0.1:
+                    rows.append(f'{epfl_prefix}EDOC {program}, {year}')
+                else:
+                    rows.append(f'{program}, {year}, Bachelor semester {rng.randint(1, 6)}')
+            rows.append(f'{rng.randint(1, 500)} ét.')
+    return rows
+
+
+def timed(parse, soup, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reg = {}
+        parse(reg, soup)
+    return reg, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    num_programs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    for i, (rows, expected) in enumerate(fixtures):
+        soup = bsoup(report_html(rows), 'html.parser')
+        for parse in (process_course_registration_report_lists, registrations.process_course_registration_report):
+            reg = {}
+            parse(reg, soup)
+            assert reg == expected, f'fixture {i}: {parse.__name__} returned {reg}'
+    print(f'{len(fixtures)} fixtures ok')
+
+    rows = synthetic_rows(num_programs)
+    soup = bsoup(report_html(rows), 'html.parser')
+    expected, t_lists = timed(process_course_registration_report_lists, soup, repeat)
+    output, t_dicts = timed(registrations.process_course_registration_report, soup, repeat)
+    assert output == expected, 'outputs differ on the synthetic report'
+    print(
+        f'{len(rows)} rows: lists {len(rows) / t_lists:,.0f} rows/s, '
+        f'dicts {len(rows) / t_dicts:,.0f} rows/s ({t_lists / t_dicts:.1f}x)'
+    )
@@ -0,0 +1,58 @@
+"""
+Compares the time and peak memory of parsing the cached pages
+into a full tree and into the scraped containers only (const.restricted_parse).
+Run a crawl first (python init.py) to fill the cache.
+
+Usage: python benchmarks/restricted_parse.py [max pages]
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+from scraper.module import cache, const, util
+
+
+def cached_pages(limit=None):
+    pages = []
+    for root, _, filenames in os.walk(cache.cache_dir):
+        for filename in sorted(filenames):
+            if filename.endswith('.json'):
+                with open(os.path.join(root, filename), encoding='utf-8') as file:
+                    pages.append(json.load(file)['body'])
+            if limit and len(pages) >= limit:
+                return pages
+    return pages
+
+
+def parse_all(pages):
+    """Returns the time and the peak memory of parsing @pages, and the parsed containers"""
+    containers = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for page in pages:
+        content, soup = util.make_soup(page, return_soup_object=True, keep_classes=['right-col'])
+        # keep the html of the containers only, so that trees are freed as in the scraper
+        containers.append((str(content), str(soup.find(class_='right-col'))))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, containers
+
+
+if __name__ == '__main__':
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    pages = cached_pages(limit)
+    print(f'{len(pages)} cached pages, parser: {const.html_parser}')
+
+    results = {}
+    for restricted in (False, True):
+        const.restricted_parse = restricted
+        elapsed, peak, containers = parse_all(pages)
+        results[restricted] = containers
+        name = 'restricted' if restricted else 'full'
+        print(f'{name:>10}: {elapsed:.2f} s, peak memory {peak / 2**20:.1f} MiB')
+
+    num_different = sum(a != b for a, b in zip(results[False], results[True]))
+    print(f'{num_different} pages with different containers')
@@ -0,0 +1,38 @@
+"""
+Times a full crawl replayed from the page cache (no network),
+i.e. the parsing cost of the scraper alone, for each number of parser processes.
+Run a crawl first (python init.py) to fill the cache.
+
+Usage: python benchmarks/scrape_offline.py [parser processes ...] (default: 0 and const.parse_workers)
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from scraper import scraper
+from scraper.module import const, fetch
+from utils import read
+
+if __name__ == '__main__':
+    const.offline = True
+    workers_list = [int(arg) for arg in sys.argv[1:]] or sorted({0, const.parse_workers})
+
+    for workers in workers_list:
+        const.parse_workers = workers
+        fetch.stats['offline'] = 0
+
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()) as output:
+            scraper.scrape(subdir='benchmark')
+        elapsed = time.perf_counter() - start
+
+        num_pages = fetch.stats['offline']
+        pipeline_summary = next(line for line in output.getvalue().splitlines() if line.startswith('>>> Pipeline'))
+        print(f'{workers} parser processes: {num_pages} pages in {elapsed:.2f} s ({num_pages / elapsed:.1f} pages/s)')
+        print(f'  {pipeline_summary}')
+    num_studyplan, num_coursebook = (
+        sum(1 for _ in read.iter_jsonl(filename, 'benchmark'))
+        for filename in ['courses-studyplan', 'courses-coursebook']
+    )
+    print(f'{num_studyplan} studyplan courses, {num_coursebook} coursebook courses')
@@ -0,0 +1,69 @@
+"""
+Compares the exhaustive scorer with inverted-index candidate pruning,
+at today's corpus size and at a synthetic 100x corpus (the corpus
+stacked onto itself), and checks that all scorers return the same results.
+
+Usage: python benchmarks/search_index.py [num_queries]
+"""
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+from search import helpers, invindex
+from search.query import search_batch
+
+
+def sample_queries(tfidf, num_queries, seed=0):
+    """Random 1-3 term queries over the vocabulary"""
+    rng = np.random.default_rng(seed)
+    vocabulary = sorted(tfidf.vocabulary_)
+    return [
+        ' '.join(rng.choice(vocabulary, size=rng.integers(1, 4)))
+        for _ in range(num_queries)
+    ]
+
+
+def timed(queries, tfidf, features, topk, batch=False, **kwargs):
+    start = time.perf_counter()
+    if batch:
+        results = search_batch(queries, tfidf, features, topk, **kwargs)
+    else:
+        results = [search_batch([q], tfidf, features, topk, **kwargs)[0] for q in queries]
+    elapsed = time.perf_counter() - start
+    # normalize for comparison
+    return [(list(ids), sims) for ids, sims in results], elapsed
+
+
+def bench(name, queries, tfidf, features, topk=10):
+    postings = invindex.build(features)
+    index = (postings, invindex.max_weights(postings))
+
+    exhaustive, t_exhaustive = timed(queries, tfidf, features, topk)
+    candidates, t_candidates = timed(queries, tfidf, features, topk, index=index, prune=False)
+    maxscore, t_maxscore = timed(queries, tfidf, features, topk, index=index)
+    batched, t_batched = timed(queries, tfidf, features, topk, batch=True, index=index)
+
+    assert candidates == exhaustive, 'candidate scorer differs from exhaustive scorer'
+    assert maxscore == exhaustive, 'MaxScore scorer differs from exhaustive scorer'
+    assert batched == exhaustive, 'batched MaxScore scorer differs from exhaustive scorer'
+
+    print(f'{name} corpus ({features.shape[0]} docs, {len(queries)} queries)')
+    for label, elapsed in (
+        ('exhaustive', t_exhaustive),
+        ('inverted index', t_candidates),
+        ('inverted index + MaxScore', t_maxscore),
+        ('MaxScore, one batch', t_batched)
+    ):
+        print(f'  {label:<26} {1000 * elapsed / len(queries):8.3f} ms/query')
+
+
+if __name__ == '__main__':
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tfidf = helpers.load_pickle('tfidf')
+    features = helpers.load_sparsemat('features').tocsr()
+    queries = sample_queries(tfidf, num_queries)
+
+    bench('today', queries, tfidf, features)
+    bench('100x', queries, tfidf, sparse.vstack([features] * 100, format='csr'))
@@ -0,0 +1,51 @@
+"""
+Compares queries per second of the one-shot search CLI
+(one python process per query) and the persistent server mode.
+
+Usage: python benchmarks/search_modes.py [num_queries]
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+
+from utils.pydir import pydir
+
+query_script = os.path.join(pydir, 'search', 'query.py')
+queries = [
+    'machine learning', 'quantum physics', 'fluid mechanics', 'cs-433',
+    'signal processing', 'linear algebra', 'architecture studio', 'finance',
+    'robotics', 'organic chemistry'
+]
+
+
+def bench_oneshot(num_queries, topk=10):
+    start = time.perf_counter()
+    for i in range(num_queries):
+        subprocess.run(
+            [sys.executable, query_script, str(topk), queries[i % len(queries)]],
+            check=True, capture_output=True
+        )
+    return num_queries / (time.perf_counter() - start)
+
+
+def bench_server(num_queries, topk=10):
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [sys.executable, query_script, '--serve'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    ) as child:
+        for i in range(num_queries):
+            child.stdin.write(json.dumps({'query': queries[i % len(queries)], 'topk': topk}) + '\n')
+            child.stdin.flush()
+            child.stdout.readline()
+        child.stdin.close()
+    # startup is included, as for the one-shot mode
+    return num_queries / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f'one-shot: {bench_oneshot(num_queries):.2f} queries/s')
+    print(f'server:   {bench_server(num_queries):.2f} queries/s')
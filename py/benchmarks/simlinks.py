@@ -0,0 +1,66 @@
+"""
+Compares the sparse-native simlinks extraction with the former pandas
+sparse DataFrame extraction for 10, 100 and all slugs, and checks
+that both produce identical output.
+
+Usage: python benchmarks/simlinks.py [threshold] [repeat]
+(threshold between 0.2 and 1)
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from numpy import nan
+
+from search import helpers, simlinks
+
+
+def find_simlinks_dataframe(similarity_threshold, slugs):
+    """Links between @slugs as JSON, read from a sparse dataframe of all the pairs above @similarity_threshold"""
+    index = helpers.load_df('index')
+    df = (
+        pd.DataFrame.sparse.from_spmatrix(
+            simlinks.load_similarities(similarity_threshold),
+            index=index.rename('source'),
+            columns=index.rename('target')
+        )
+        .astype(pd.SparseDtype('float', nan))
+    )
+    boolean_index = index.isin(slugs).values
+    df = df.loc[boolean_index, boolean_index]
+    # pair row and column indices (ignores NaNs)
+    df = df.stack().sparse.to_dense().dropna().rename('similarity').reset_index()
+    df['id'] = df.source + '--' + df.target
+    return df.to_json(orient='records')
+
+
+def find_simlinks_sparse(similarity_threshold, slugs):
+    index, slug_ids = simlinks.load_index()
+    similarities = simlinks.load_similarities(similarity_threshold)
+    return simlinks.find_simlinks(similarities, index, slug_ids, slugs).to_json(orient='records')
+
+
+def timed(fn, repeat, *args):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = fn(*args)
+    return output, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    similarity_threshold = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    all_slugs = list(helpers.load_df('index'))
+    rng = np.random.default_rng(0)
+
+    for size in (10, 100, len(all_slugs)):
+        slugs = list(rng.choice(all_slugs, size=size, replace=False))
+        expected, t_dataframe = timed(find_simlinks_dataframe, repeat, similarity_threshold, slugs)
+        output, t_sparse = timed(find_simlinks_sparse, repeat, similarity_threshold, slugs)
+        assert output == expected, f'outputs differ for {size} slugs'
+        print(
+            f'{size:>5} slugs: dataframe {1000 * t_dataframe:9.1f} ms, '
+            f'sparse {1000 * t_sparse:9.1f} ms ({t_dataframe / t_sparse:.1f}x)'
+        )
@@ -0,0 +1,118 @@
+"""
+Runs the store step against an in-memory fake redis (pip install fakeredis) and checks
+that every entity is written as a hash of its json, gzip, brotli (if installed) and ETag,
+that the version key only moves once all keys of the new version are written,
+that older versions and unversioned keys are deleted, and that a failed compute
+or write leaves the version unchanged.
+Run postprocess first (python init.py) to write the processed data.
+
+Usage: python benchmarks/store_redis.py [batch size]
+"""
+import sys
+import copy
+import gzip
+import json
+import hashlib
+
+import fakeredis
+
+from db import store
+
+fake = fakeredis.FakeRedis()
+# store.main() connects with redis.Redis(...).from_url(store.redis_url)
+store.redis.Redis.from_url = lambda *args, **kwargs: fake
+
+# number of keys of the new version when the version key is set
+switches = []
+fake_set = fake.set
+
+
+def set_checked(name, value, *args, **kwargs):
+    if name == store.version_key:
+        switches.append(sum(1 for _ in fake.scan_iter(match=f'{store.version_prefix(value)}*')))
+    return fake_set(name, value, *args, **kwargs)
+
+
+fake.set = set_checked
+
+
+def current_version():
+    return int(fake.get(store.version_key) or 0)
+
+
+def versions():
+    """Versions that have keys in redis"""
+    return sorted({int(key.split(b':', 1)[0][1:]) for key in fake.scan_iter(match='v*:*')})
+
+
+def check_fields(key, payload):
+    fields = fake.hgetall(key)
+    assert fields[b'json'] == payload, f'{key}: json differs'
+    assert gzip.decompress(fields[b'gzip']) == payload, f'{key}: gzip differs'
+    assert fields[b'etag'].decode() == f'"{hashlib.sha1(payload).hexdigest()}"', f'{key}: etag differs'
+    if store.brotli is not None:
+        assert store.brotli.decompress(fields[b'br']) == payload, f'{key}: br differs'
+
+
+def fails(run):
+    try:
+        run()
+    except RuntimeError:
+        return True
+    return False
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        store.batch_size = int(sys.argv[1])
+    # serialized as they are computed, since entities() changes them afterwards
+    expected = [(key, json.dumps(data).encode()) for key, data in store.entities(copy.deepcopy(store.epfl))]
+
+    # keys written before versioning, and keys left by a load of version 1 that failed
+    for key in ('nav', 'epfl_master', 'course_cs-101'):
+        fake_set(key, '{}')
+    fake.hset('v1:course_partial', mapping={'json': '{}'})
+
+    store.main()
+    assert current_version() == 1 and versions() == [1]
+    assert not fake.exists('nav', 'epfl_master', 'course_cs-101', 'v1:course_partial'), 'stale keys left'
+    for key, payload in expected:
+        check_fields(f'v1:{key}', payload)
+
+    # the API may still read the previous version while the pointer moves
+    store.main()
+    assert current_version() == 2 and versions() == [1, 2]
+    store.main()
+    assert current_version() == 3 and versions() == [2, 3]
+    assert switches == [len(expected)] * 3, f'version switched with {switches} keys written'
+
+    # a failed compute stops the writer and keeps the current version
+    entities = store.entities
+
+    def failing_entities(epfl):
+        for i, entity in enumerate(entities(epfl)):
+            if i == store.batch_size + 1:
+                raise RuntimeError('compute failed')
+            yield entity
+
+    store.entities = failing_entities
+    assert fails(store.main), 'failed compute did not raise'
+    store.entities = entities
+    assert current_version() == 3 and len(switches) == 3
+
+    # so does a failed write
+    fake_pipeline = fake.pipeline
+
+    def failing_pipeline(*args, **kwargs):
+        raise RuntimeError('write failed')
+
+    fake.pipeline = failing_pipeline
+    assert fails(store.main), 'failed write did not raise'
+    fake.pipeline = fake_pipeline
+    assert current_version() == 3 and len(switches) == 3
+
+    # the next load replaces the keys left by the failed ones
+    store.main()
+    assert current_version() == 4 and versions() == [3, 4]
+    assert sum(1 for _ in fake.scan_iter(match='v4:*')) == len(expected)
+    print(f'{len(expected)} keys checked over {len(switches)} versions')
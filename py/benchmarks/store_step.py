@@ -0,0 +1,57 @@
+"""
+Times the store step without redis (computing and serializing every entity)
+with the slug-keyed course lookup and with the former scan of all courses,
+and checks that every entity is identical.
+Run postprocess first (python init.py) to write the processed data.
+
+Usage: python benchmarks/store_step.py [repeat]
+"""
+import sys
+import copy
+import json
+import time
+
+from db import store
+
+
+def resolve_slugs_scan(slugs, incoming=False, outgoing=False):
+    """Minimal courses whose slug is in @slugs, found by testing every course of the store"""
+    neighborhood_key = store.get_neighborhood_key(incoming, outgoing)
+    return [
+        {
+            **course,
+            'incoming': incoming,
+            'outgoing': outgoing,
+            'neighborhoodKey': neighborhood_key
+        }
+        for course in store.courses_minimal
+        if course['slug'] in slugs
+    ]
+
+
+def store_step(resolve_slugs, repeat):
+    """Serialized data of each redis key, and the seconds to compute them"""
+    store.resolve_slugs = resolve_slugs
+    # entities() deletes the course lists of its argument
+    epfls = [copy.deepcopy(store.epfl) for _ in range(repeat)]
+    start = time.perf_counter()
+    for epfl in epfls:
+        payloads = {key: json.dumps(data) for key, data in store.entities(epfl)}
+    return payloads, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    resolve_slugs_lookup = store.resolve_slugs
+    expected, t_scan = store_step(resolve_slugs_scan, repeat)
+    output, t_lookup = store_step(resolve_slugs_lookup, repeat)
+    store.resolve_slugs = resolve_slugs_lookup
+
+    assert output.keys() == expected.keys(), 'keys differ'
+    differences = [key for key in expected if output[key] != expected[key]]
+    assert not differences, f'{len(differences)} entities differ, e.g. {differences[:5]}'
+    print(
+        f'{len(output)} entities: scan {t_scan:.2f} s, lookup {t_lookup:.2f} s '
+        f'({t_scan / t_lookup:.1f}x)'
+    )
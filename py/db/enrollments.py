@@ -0,0 +1,177 @@
+"""
+Columnar store of the enrollment counts scraped from the ISA registration reports.
+
+Each row is one program of a count: (course, academic year, program, semester, count),
+with the dimensions coded as integers into sorted tables of names. A count of a report
+can cover several programs together, so the rows of a count share a group id and
+course totals add each group once, while program totals add every group that lists the program.
+Rows are sorted by course, and a permutation sorts them by program, so that
+both kinds of queries read a contiguous slice.
+
+Build it from data/raw/registrations.jsonl with:
+python db/enrollments.py
+"""
+import sys
+import json
+
+import numpy as np
+
+from utils import read
+from utils.pydir import datadir
+from utils.serve import serve_lines
+from scraper.module.registrations import merge_registrations
+
+store_path = f'{datadir}/enrollments.npz'
+dimensions = ['course', 'year', 'program', 'semester']
+
+
+def load_registrations():
+    """
+    Registrations by course name, year and programs, merged as registrations.scrape does,
+    and the (program, semesters) pairs of each count with the same keys
+    """
+    registrations_data = {}
+    programs_data = {}
+    for record in read.iter_jsonl('registrations', 'raw'):
+        if 'programs' not in record:
+            raise ValueError(
+                f"Registrations of {record['id']} were scraped without their programs, "
+                'run python scraper/module/registrations.py again'
+            )
+        merge_registrations(registrations_data, record['name'], record['registrations'])
+        merge_registrations(programs_data, record['name'], record['programs'])
+    return registrations_data, programs_data
+
+
+def build(registrations_data, programs_data):
+    """
+    Returns the arrays of the store of @registrations_data (by course name, year and programs),
+    with the (program, semesters) pairs of each count from @programs_data
+    """
+    rows = []
+    group = 0
+    for course, years in registrations_data.items():
+        for year, counts in years.items():
+            for programs_key, count in counts.items():
+                for program, semesters in programs_data[course][year][programs_key]:
+                    rows.append((course, year, program, semesters, group, count))
+                group += 1
+
+    store = {}
+    columns = list(zip(*rows)) or [()] * 6
+    for name, values in zip(dimensions, columns):
+        table = sorted(set(values))
+        codes = {value: code for code, value in enumerate(table)}
+        store[f'{name}s'] = np.array(table, dtype=str)
+        store[name] = np.array([codes[value] for value in values], dtype=np.int32)
+    store['group'] = np.array(columns[4], dtype=np.int32)
+    store['count'] = np.array(columns[5], dtype=np.int32)
+
+    # sort by course, year and group (stable, so programs keep their order within a count)
+    order = np.lexsort((store['group'], store['year'], store['course']))
+    for name in dimensions + ['group', 'count']:
+        store[name] = store[name][order]
+    # first row of each group, so that courses count each group once
+    store['first'] = np.ones(len(order), dtype=bool)
+    store['first'][1:] = store['group'][1:] != store['group'][:-1]
+    store['byProgram'] = np.argsort(store['program'], kind='stable').astype(np.int32)
+    return store
+
+
+def save(store):
+    np.savez(store_path, **store)
+
+
+def load():
+    with np.load(store_path) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def codes(store, name):
+    """Code of each value of the dimension @name, e.g. codes(store, 'course')['Analysis I']"""
+    return {value: code for code, value in enumerate(store[f'{name}s'].tolist())}
+
+
+def totals(store, rows, name, first_only=False):
+    """Sums the counts of @rows by the dimension @name, as a {value: count} dict"""
+    if first_only:
+        rows = rows[store['first'][rows]]
+    sums = np.bincount(store[name][rows], weights=store['count'][rows], minlength=len(store[f'{name}s']))
+    return {store[f'{name}s'][code]: int(sums[code]) for code in np.flatnonzero(sums)}
+
+
+def course_rows(store, course):
+    """Indices of the rows of the course code @course"""
+    start, end = np.searchsorted(store['course'], [course, course + 1])
+    return np.arange(start, end)
+
+
+def program_rows(store, program):
+    """Indices of the rows of the program code @program"""
+    start, end = np.searchsorted(store['program'], [program, program + 1], sorter=store['byProgram'])
+    return store['byProgram'][start:end]
+
+
+def course_by_year(store, course):
+    """Students of the course code @course by year (counts covering several programs are added once)"""
+    return totals(store, course_rows(store, course), 'year', first_only=True)
+
+
+def course_by_program(store, course, year):
+    """Students of the course code @course in the year code @year, by program"""
+    rows = course_rows(store, course)
+    return totals(store, rows[store['year'][rows] == year], 'program')
+
+
+def program_by_year(store, program):
+    """Course registrations of the program code @program by year"""
+    return totals(store, program_rows(store, program), 'year')
+
+
+def program_by_course(store, program, year):
+    """Registrations of the program code @program in the year code @year, by course"""
+    rows = program_rows(store, program)
+    return totals(store, rows[store['year'][rows] == year], 'course')
+
+
+def query(store, lookup, request):
+    """
+    Answers {"course": name} with its students by year, and by program for each year,
+    and {"program": name} with its registrations by year, and by course for each year
+    (names without registrations get empty answers). @lookup holds the codes of each dimension.
+    """
+    if 'course' in request:
+        course = lookup['course'].get(request['course'])
+        by_year = {} if course is None else course_by_year(store, course)
+        by_program = lambda year: course_by_program(store, course, year)
+    else:
+        program = lookup['program'].get(request['program'])
+        by_year = {} if program is None else program_by_year(store, program)
+        by_program = lambda year: program_by_course(store, program, year)
+    return {
+        'years': by_year,
+        'details': {year: by_program(lookup['year'][year]) for year in by_year}
+    }
+
+
+def serve(infile=sys.stdin, outfile=sys.stdout):
+    """
+    Answers enrollment queries until @infile is closed,
+    one JSON request per line and one JSON answer per line, in the same order.
+    """
+    store = load()
+    lookup = {name: codes(store, name) for name in dimensions}
+
+    serve_lines(lambda request: json.dumps(query(store, lookup, request)), infile, outfile)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == '--serve':
+        serve()
+    else:
+        store = build(*load_registrations())
+        save(store)
+        print(
+            f"Enrollment store written to {store_path}: {len(store['count'])} rows, "
+            + ', '.join(f"{len(store[f'{name}s'])} {name}s" for name in dimensions)
+        )
@@ -3,10 +3,21 @@
 
 import json
 import copy
+import gzip
+import time
+import queue
+import hashlib
 import redis
 from os import getenv
+from concurrent.futures import ThreadPoolExecutor
 from utils import read
 
+try:
+    # optional: payloads are also stored brotli-compressed when installed
+    import brotli
+except ImportError:
+    brotli = None
+
 epfl = read.read_json_processed('epfl')
 courses = read.read_json_processed('courses')
 links = read.read_json_processed('links')
@@ -18,6 +29,8 @@ minimal_keys = (
     'credits', 'language', 'examForm', 'lecturers'
 )
 courses_minimal = [dict((k, c[k]) for k in minimal_keys) for c in courses]
+# position of each course in `courses`, to resolve slugs in the order of the courses
+course_positions = {c['slug']: i for i, c in enumerate(courses_minimal)}
 
 def get_neighborhood_key(incoming, outgoing):
     if incoming and outgoing:
@@ -33,40 +46,52 @@ def resolve_slugs(slugs, incoming=False, outgoing=False):
     # the courses listed in `slugs` are by default not
     # part of the neighborhood
     neighborhood_key = get_neighborhood_key(incoming, outgoing)
+    positions = sorted({course_positions[slug] for slug in slugs if slug in course_positions})
     return [
         {
-            **course,
+            **courses_minimal[i],
             'incoming': incoming,
             'outgoing': outgoing,
             'neighborhoodKey': neighborhood_key
         }
-        for course in courses_minimal
-        if course['slug'] in slugs
+        for i in positions
     ]
 
 
+# adjacency index: positions in `links` of the links to (incoming) and from (outgoing) each course
+incoming_link_ids = {}
+outgoing_link_ids = {}
+for link_id, l in enumerate(links):
+    incoming_link_ids.setdefault(l['target'], []).append(link_id)
+    outgoing_link_ids.setdefault(l['source'], []).append(link_id)
+
+
 def filter_links(slugs):
-    return [
-        l for l in links
-        if l['source'] in slugs or l['target'] in slugs
-    ]
+    """Links from or to the courses of the set @slugs, in the order of `links`"""
+    link_ids = set()
+    for slug in slugs:
+        link_ids.update(incoming_link_ids.get(slug, ()))
+        link_ids.update(outgoing_link_ids.get(slug, ()))
+    return [links[link_id] for link_id in sorted(link_ids)]
 
 
 
 def compute_graph(slugs, subgraph_courses):
+    slugs = set(slugs)
     links_filtered = filter_links(slugs)
 
     incoming_links = [
         l for l in links_filtered
-        if l['source'] not in slugs and l['target'] in slugs
+        if l['source'] not in slugs
     ]
     outgoing_links = [
         l for l in links_filtered
-        if l['target'] not in slugs and l['source'] in slugs
+        if l['target'] not in slugs
     ]
+    # links between two courses of the subgraph
     subgraph_links = [
         l for l in links_filtered
-        if l not in incoming_links and l not in outgoing_links
+        if l['source'] in slugs and l['target'] in slugs
     ]
     incoming_slugs = set(l['source'] for l in incoming_links)
     outgoing_slugs = set(l['target'] for l in outgoing_links)
@@ -114,62 +139,23 @@ def compute_filters(courses):
 redis_url = getenv("REDIS_URL")
 redis_url = redis_url if redis_url else 'redis://@localhost:6379'
 
-r = redis.Redis(ssl_cert_reqs=None).from_url(redis_url)
+# number of keys written by each redis pipeline
+batch_size = int(getenv('STORE_BATCH_SIZE', 200))
+
+# compression levels of the stored payloads
+gzip_level = int(getenv('STORE_GZIP_LEVEL', 9))
+brotli_quality = int(getenv('STORE_BROTLI_QUALITY', 11))
+
+# each load is written under its own key prefix, v{n}:, and this key points to the version the API reads
+version_key = 'dataset_version'
 
 def redis_key(*slugs, prefix_slug = 'epfl'):
     return '_'.join([prefix_slug, *slugs])
 
-def redis_set(key, data_dict):
-    r.set(key, json.dumps(data_dict))
-
 
 all_courses_title = 'All courses'
 all_courses_slug = 'all-courses'
 
-# navigation info for Vuetify treeview and autocomplete components
-nav_treeview = [
-    {
-        'id': l['slug'],
-        'name': l['title'],
-        'params': {
-            'level': l['slug'],
-            'program': None,
-            'specialization': None
-        },
-        'courses': l['courses'],
-        'children': [
-            {
-                'id': f"{l['slug']}-{p['slug']}",
-                'name': p['title'],
-                'params': {
-                    'level': l['slug'],
-                    'program': p['slug'],
-                    'specialization': None
-                },
-                'courses': p['courses'],
-                'children': [
-                    {
-                        'id': f"{l['slug']}-{p['slug']}-{s['slug']}",
-                        'name': s['title'],
-                        'value': s['value'],
-                        'params': {
-                            'level': l['slug'],
-                            'program': p['slug'],
-                            'specialization': s['slug']
-                        },
-                        'courses': s['courses'],
-                        'children': []
-                    }
-                    for s in p['specializations']
-                ]
-                if l['slug'] == 'master' else []
-            }
-            for p in l['programs']
-        ]
-    }
-    for l in epfl['levels']
-]
-
 
 def create_path(level=None, program=None, specialization=None):
     path = ''
@@ -183,186 +169,368 @@ def create_path(level=None, program=None, specialization=None):
     return f'/{all_courses_slug}'
 
 
-nav_autocomplete = [{
-    'title': all_courses_title,
-    'path': create_path(),
-    'icon': 'mdi-all-inclusive',
-    # 'parent': []
-},{
-    'divider': True,
-    # 'parent': []
-}]
-for l in epfl['levels']:
-    # level_path = create_path(l['slug'])
-    nav_autocomplete.extend([{
-        'title': l['title'],
-        'path': create_path(l['slug']),
-        'icon': 'mdi-school-outline',
-        # 'parent': all_courses_path,
-    },
-    {
+# navigation info for Vuetify treeview and autocomplete components
+def compute_nav_treeview(epfl):
+    return [
+        {
+            'id': l['slug'],
+            'name': l['title'],
+            'params': {
+                'level': l['slug'],
+                'program': None,
+                'specialization': None
+            },
+            'courses': l['courses'],
+            'children': [
+                {
+                    'id': f"{l['slug']}-{p['slug']}",
+                    'name': p['title'],
+                    'params': {
+                        'level': l['slug'],
+                        'program': p['slug'],
+                        'specialization': None
+                    },
+                    'courses': p['courses'],
+                    'children': [
+                        {
+                            'id': f"{l['slug']}-{p['slug']}-{s['slug']}",
+                            'name': s['title'],
+                            'value': s['value'],
+                            'params': {
+                                'level': l['slug'],
+                                'program': p['slug'],
+                                'specialization': s['slug']
+                            },
+                            'courses': s['courses'],
+                            'children': []
+                        }
+                        for s in p['specializations']
+                    ]
+                    if l['slug'] == 'master' else []
+                }
+                for p in l['programs']
+            ]
+        }
+        for l in epfl['levels']
+    ]
+
+
+def compute_nav_autocomplete(epfl):
+    nav_autocomplete = [{
+        'title': all_courses_title,
+        'path': create_path(),
+        'icon': 'mdi-all-inclusive',
+        # 'parent': []
+    },{
         'divider': True,
-        # 'parent': level_path
-    },
-    {
-        'header': f"{l['title']} Programs",
-        # 'parent': level_path
-    }])
-    for p_idx, p in enumerate(l['programs']):
-        # program_path = create_path(l['slug'], p['slug'])
-        nav_autocomplete.append({
-            'title': p['title'],
-            'subtitle': l['title'],
-            'path': create_path(l['slug'], p['slug']),
-            'icon': 'mdi-school',
+        # 'parent': []
+    }]
+    for l in epfl['levels']:
+        # level_path = create_path(l['slug'])
+        nav_autocomplete.extend([{
+            'title': l['title'],
+            'path': create_path(l['slug']),
+            'icon': 'mdi-school-outline',
+            # 'parent': all_courses_path,
+        },
+        {
+            'divider': True,
             # 'parent': level_path
-        })
+        },
+        {
+            'header': f"{l['title']} Programs",
+            # 'parent': level_path
+        }])
+        for p_idx, p in enumerate(l['programs']):
+            # program_path = create_path(l['slug'], p['slug'])
+            nav_autocomplete.append({
+                'title': p['title'],
+                'subtitle': l['title'],
+                'path': create_path(l['slug'], p['slug']),
+                'icon': 'mdi-school',
+                # 'parent': level_path
+            })
+
+            if l['slug'] == 'master' and len(p['specializations']) > 0:
+                nav_autocomplete.extend([{
+                    'divider': True,
+                    # 'parent': program_path
+                },
+                {
+                    'header': f"{p['title']} Master Specializations",
+                    # 'parent': program_path
+                }])
+                for s in p['specializations']:
+                    # spec_path = create_path(l['slug'], p['slug'], s['slug'])
+                    nav_autocomplete.append({
+                        'title': s['title'],
+                        'subtitle': f"{p['title']} Master Specialization",
+                        'path': create_path(l['slug'], p['slug'], s['slug']),
+                        'specializationValue': s['value'],
+                        # 'parent': program_path
+                    })
 
-        if l['slug'] == 'master' and len(p['specializations']) > 0:
-            nav_autocomplete.extend([{
-                'divider': True,
-                # 'parent': program_path
-            },
-            {
-                'header': f"{p['title']} Master Specializations",
-                # 'parent': program_path
-            }])
-            for s in p['specializations']:
-                # spec_path = create_path(l['slug'], p['slug'], s['slug'])
                 nav_autocomplete.append({
-                    'title': s['title'],
-                    'subtitle': f"{p['title']} Master Specialization",
-                    'path': create_path(l['slug'], p['slug'], s['slug']),
-                    'specializationValue': s['value'],
+                    'divider': True,
                     # 'parent': program_path
                 })
+        nav_autocomplete.append({
+            'divider': True,
+            # 'parent': level_path
+        })
+    return nav_autocomplete
+
+
+def entities(epfl):
+    """
+    Yields the redis key and data of the navigation, the root, each level, program
+    and specialization, and each course. The course lists of @epfl are deleted along the way,
+    so each data must be serialized before the next one is computed.
+    """
+    nav_treeview = compute_nav_treeview(epfl)
+    nav_autocomplete = compute_nav_autocomplete(epfl)
+
+    # root data object
+    # need to create a deep copy since we delete level['programs']
+    cepfl = copy.deepcopy(epfl)
+    cepfl_slugs = cepfl['courses']
+    del cepfl['courses']
+    cepfl_courses = resolve_slugs(cepfl_slugs)
+    all_filters = compute_filters(cepfl_courses)
+
+    nav_treeview = {
+        'id': all_courses_slug,
+        'name': all_courses_title,
+        'params': {
+            'level': all_courses_slug,
+            'program': None,
+            'specialization': None
+        },
+        'courses': epfl['courses'],
+        'children': nav_treeview
+    }
 
-            nav_autocomplete.append({
-                'divider': True,
-                # 'parent': program_path
-            })
-    nav_autocomplete.append({
-        'divider': True,
-        # 'parent': level_path
-    })
-
-
-# root data object
-# need to create a deep copy since we delete level['programs']
-cepfl = copy.deepcopy(epfl)
-cepfl_slugs = cepfl['courses']
-del cepfl['courses']
-cepfl_courses = resolve_slugs(cepfl_slugs)
-all_filters = compute_filters(cepfl_courses)
-
-nav_treeview = {
-    'id': all_courses_slug,
-    'name': all_courses_title,
-    'params': {
-        'level': all_courses_slug,
-        'program': None,
-        'specialization': None
-    },
-    'courses': epfl['courses'],
-    'children': nav_treeview
-}
-
-nav = {
-    'treeview': nav_treeview,
-    'autocomplete': nav_autocomplete,
-    # pass all filter options
-    'allFilterOptions': all_filters['filterOptions']
-}
-redis_set(redis_key(prefix_slug = 'nav'), nav)
-
-cepfl = {
-    'entity': 'root',
-    'subentityKey': 'levels',
-    'title': all_courses_title,
-    'slug': all_courses_slug,
-    **cepfl,
-    'treeview': nav_treeview,
-    **compute_graph(cepfl_slugs, cepfl_courses),
-    **all_filters
-}
-
-for level in cepfl['levels']:
-    del level['programs']
-
-redis_set(redis_key(), cepfl)
-specializationsKey = 'specializations'
-programsKey = 'programs'
-
-for l_idx, level in enumerate(epfl['levels']):
-    clevel = level
-    if level['slug'] == 'master':
-        # need to create a deep copy since we delete a property
-        clevel = copy.deepcopy(level)
-        for p in clevel[programsKey]:
-            del p[specializationsKey]
-
-    clevel_slugs = clevel['courses']
-    del clevel['courses']
-    clevel_courses = resolve_slugs(clevel_slugs)
-
-    clevel = {
-        'entity': 'level',
-        'subentityKey': programsKey,
-        **clevel,
-        'treeview': nav_treeview['children'][l_idx],
-        **compute_graph(clevel_slugs, clevel_courses),
-        **compute_filters(clevel_courses)
+    nav = {
+        'treeview': nav_treeview,
+        'autocomplete': nav_autocomplete,
+        # pass all filter options
+        'allFilterOptions': all_filters['filterOptions']
+    }
+    yield redis_key(prefix_slug = 'nav'), nav
+
+    cepfl = {
+        'entity': 'root',
+        'subentityKey': 'levels',
+        'title': all_courses_title,
+        'slug': all_courses_slug,
+        **cepfl,
+        'treeview': nav_treeview,
+        **compute_graph(cepfl_slugs, cepfl_courses),
+        **all_filters
     }
 
-    key = redis_key(level['slug'])
-    redis_set(key, clevel)
+    for level in cepfl['levels']:
+        del level['programs']
 
-    for p_idx, program in enumerate(level[programsKey]):
+    yield redis_key(), cepfl
+    specializationsKey = 'specializations'
+    programsKey = 'programs'
+
+    for l_idx, level in enumerate(epfl['levels']):
+        clevel = level
         if level['slug'] == 'master':
-            # Master program
-            for s_idx, specialization in enumerate(program[specializationsKey]):
-                # Store specializations (if any)
-                s = copy.deepcopy(specialization)
-                s_slugs = s['courses']
-                del s['courses']
-                s_courses = resolve_slugs(s_slugs)
-                s = {
-                    'entity': 'specialization',
-                    **s,
-                    'treeview': nav_treeview['children'][l_idx]['children'][p_idx]['children'][s_idx],
-                    **compute_graph(s_slugs, s_courses),
-                    **compute_filters(s_courses)
-                }
+            # need to create a deep copy since we delete a property
+            clevel = copy.deepcopy(level)
+            for p in clevel[programsKey]:
+                del p[specializationsKey]
+
+        clevel_slugs = clevel['courses']
+        del clevel['courses']
+        clevel_courses = resolve_slugs(clevel_slugs)
+
+        clevel = {
+            'entity': 'level',
+            'subentityKey': programsKey,
+            **clevel,
+            'treeview': nav_treeview['children'][l_idx],
+            **compute_graph(clevel_slugs, clevel_courses),
+            **compute_filters(clevel_courses)
+        }
+
+        key = redis_key(level['slug'])
+        yield key, clevel
+
+        for p_idx, program in enumerate(level[programsKey]):
+            if level['slug'] == 'master':
+                # Master program
+                for s_idx, specialization in enumerate(program[specializationsKey]):
+                    # Store specializations (if any)
+                    s = copy.deepcopy(specialization)
+                    s_slugs = s['courses']
+                    del s['courses']
+                    s_courses = resolve_slugs(s_slugs)
+                    s = {
+                        'entity': 'specialization',
+                        **s,
+                        'treeview': nav_treeview['children'][l_idx]['children'][p_idx]['children'][s_idx],
+                        **compute_graph(s_slugs, s_courses),
+                        **compute_filters(s_courses)
+                    }
 
-                key = redis_key(level['slug'], program['slug'], specialization['slug'])
-                redis_set(key, s)
+                    key = redis_key(level['slug'], program['slug'], specialization['slug'])
+                    yield key, s
 
-            if len(program[specializationsKey]) == 0:
-                # Remove property if there are no specializations
-                del program[specializationsKey]
+                if len(program[specializationsKey]) == 0:
+                    # Remove property if there are no specializations
+                    del program[specializationsKey]
 
-        program_slugs = program['courses']
-        del program['courses']
-        program_courses = resolve_slugs(program_slugs)
+            program_slugs = program['courses']
+            del program['courses']
+            program_courses = resolve_slugs(program_slugs)
 
-        p = {
-            'entity': 'program'
-        }
-        if specializationsKey in program:
-            p['subentityKey'] = specializationsKey
-        p = {
-            **p,
-            **program,
-            'treeview': nav_treeview['children'][l_idx]['children'][p_idx],
-            **compute_graph(program_slugs, program_courses),
-            **compute_filters(program_courses)
-        }
+            p = {
+                'entity': 'program'
+            }
+            if specializationsKey in program:
+                p['subentityKey'] = specializationsKey
+            p = {
+                **p,
+                **program,
+                'treeview': nav_treeview['children'][l_idx]['children'][p_idx],
+                **compute_graph(program_slugs, program_courses),
+                **compute_filters(program_courses)
+            }
+
+            key = redis_key(level['slug'], program['slug'])
+            yield key, p
 
-        key = redis_key(level['slug'], program['slug'])
-        redis_set(key, p)
 
+    for course in courses:
 
-for course in courses:
+        key = redis_key(course['slug'], prefix_slug='course')
+        yield key, course
 
-    key = redis_key(course['slug'], prefix_slug='course')
-    redis_set(key, course)
+
+def payload_fields(payload):
+    """
+    Fields of the redis hash of the serialized data @payload (bytes): the json itself,
+    its gzip and brotli (if installed) compressions, and its ETag
+    """
+    fields = {
+        'json': payload,
+        'gzip': gzip.compress(payload, compresslevel=gzip_level, mtime=0),
+        'etag': f'"{hashlib.sha1(payload).hexdigest()}"'
+    }
+    if brotli is not None:
+        fields['br'] = brotli.compress(payload, quality=brotli_quality)
+    return fields
+
+
+def write_batches(r, batches, timings):
+    """Writes the batches of (key, hash fields) of the queue @batches, one pipeline each, until None"""
+    try:
+        while (batch := batches.get()) is not None:
+            start = time.perf_counter()
+            pipe = r.pipeline(transaction=False)
+            for key, fields in batch:
+                pipe.hset(key, mapping=fields)
+            pipe.execute()
+            timings['write'] += time.perf_counter() - start
+    except Exception:
+        # let the producer finish instead of blocking on the full queue
+        while batches.get() is not None:
+            pass
+        raise
+
+
+def version_prefix(version):
+    return f'v{version}:'
+
+
+def unlink_keys(r, keys):
+    """Deletes @keys with UNLINK (memory is freed in the background), `batch_size` keys per command"""
+    for i in range(0, len(keys), batch_size):
+        r.unlink(*keys[i:i + batch_size])
+    return len(keys)
+
+
+def stale_keys(r, version):
+    """
+    Keys of the versions before @version - 1 (the API may still be reading version - 1),
+    and unversioned keys written before versioning
+    """
+    keys = []
+    for key in r.scan_iter(match='v*:*', count=1000):
+        key_version = key.split(b':', 1)[0][1:]
+        if key_version.isdigit() and int(key_version) < version - 1:
+            keys.append(key)
+    for pattern in ('nav', 'epfl*', 'course_*'):
+        keys.extend(r.scan_iter(match=pattern, count=1000))
+    return keys
+
+
+def main():
+    """
+    Computes, serializes and compresses the entities while a thread writes them to redis,
+    in pipelines of `batch_size` keys, under the prefix of a new version.
+    Once all keys are written, the version key is switched to the new version
+    and the older versions are deleted. Prints the time spent in each phase.
+    """
+    r = redis.Redis(ssl_cert_reqs=None).from_url(redis_url)
+    timings = {'compute': 0.0, 'serialize': 0.0, 'compress': 0.0, 'write': 0.0, 'gc': 0.0}
+    version = int(r.get(version_key) or 0) + 1
+    prefix = version_prefix(version)
+    # keys left by a load of this version that failed
+    unlink_keys(r, list(r.scan_iter(match=f'{prefix}*', count=1000)))
+    num_keys = 0
+    num_bytes = dict.fromkeys(['json', 'gzip', 'br'] if brotli else ['json', 'gzip'], 0)
+    start = time.perf_counter()
+
+    batches = queue.Queue(maxsize=4)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        writer = executor.submit(write_batches, r, batches, timings)
+        try:
+            batch = []
+            compute_start = time.perf_counter()
+            # entities() deletes the course lists of its argument, so that main() can run again
+            for key, data_dict in entities(copy.deepcopy(epfl)):
+                serialize_start = time.perf_counter()
+                timings['compute'] += serialize_start - compute_start
+                payload = json.dumps(data_dict).encode()
+                compress_start = time.perf_counter()
+                timings['serialize'] += compress_start - serialize_start
+                fields = payload_fields(payload)
+                timings['compress'] += time.perf_counter() - compress_start
+
+                batch.append((prefix + key, fields))
+                num_keys += 1
+                for encoding in num_bytes:
+                    num_bytes[encoding] += len(fields[encoding])
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = []
+                compute_start = time.perf_counter()
+
+            if batch:
+                batches.put(batch)
+        finally:
+            # also stops the writer when computing the entities fails
+            batches.put(None)
+        writer.result()
+
+    # the API reads the new version from now on
+    r.set(version_key, version)
+    gc_start = time.perf_counter()
+    num_deleted = unlink_keys(r, stale_keys(r, version))
+    timings['gc'] = time.perf_counter() - gc_start
+
+    sizes = ', '.join(f'{encoding} {size / 2**20:.1f} MiB' for encoding, size in num_bytes.items())
+    print(
+        f'>>> Stored version {version}: {num_keys} keys ({sizes}) in pipelines of {batch_size}, '
+        f'{num_deleted} stale keys deleted: '
+        + ', '.join(f'{phase} {seconds:.2f} s' for phase, seconds in timings.items())
+        + f', total {time.perf_counter() - start:.2f} s'
+    )
+
+if __name__ == '__main__':
+    main()
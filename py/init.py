@@ -1,12 +1,25 @@
+import sys
 from scraper import scraper
+from scraper.module import const
 from utils import write
 
 print('Running init.py...')
 
-programs_info, courses_studyplan, courses_coursebook = scraper.scrape()
-write.write_object_raw('programs', programs_info)
-write.write_object_raw('courses-studyplan', courses_studyplan)
-write.write_object_raw('courses-coursebook', courses_coursebook)
+if '--offline' in sys.argv:
+    # replay the crawl from the page cache
+    const.offline = True
+
+# only parse the pages that changed since the previous crawl
+incremental = '--incremental' in sys.argv
+
+# continue an interrupted crawl from its checkpoint
+resume = '--resume' in sys.argv
+
+# records are streamed to data/raw/*.jsonl as levels are scraped
+changes = scraper.scrape(incremental, resume)
+# slugs of the programs and courses that changed, for the later stages
+write.write_object_raw('changes', changes)
 
 from postprocess import postprocess
 from db import store
+store.main()
@@ -5,9 +5,9 @@ import pandas as pd
 from utils import read, write
 
 
-programs = read.read_json_raw('programs')
-courses_studyplan = read.read_json_raw('courses-studyplan')
-courses_coursebook = read.read_json_raw('courses-coursebook')
+programs = read.read_jsonl_raw('programs')
+courses_studyplan = read.read_jsonl_raw('courses-studyplan')
+courses_coursebook = read.read_jsonl_raw('courses-coursebook')
 
 ###################################
 # Process `courses_studyplan`     #
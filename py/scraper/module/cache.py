@@ -0,0 +1,48 @@
+"""
+On-disk cache of fetched pages, keyed by URL.
+Each entry stores the body with its ETag and Last-Modified headers,
+so that the next crawl can revalidate it with a conditional request.
+"""
+import os
+import json
+import hashlib
+
+from utils import write
+from utils.pydir import datadir
+
+cache_dir = os.path.join(datadir, 'cache', 'http')
+
+
+def entry_path(url):
+    key = hashlib.sha1(url.encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], f'{key}.json')
+
+
+def lookup(url):
+    """Returns the cached entry of @url (url, etag, lastModified, body) or None"""
+    try:
+        with open(entry_path(url), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def store(url, body, etag=None, last_modified=None):
+    entry = {
+        'url': url,
+        'etag': etag,
+        'lastModified': last_modified,
+        'body': body
+    }
+    write.replace_json(entry_path(url), entry)
+
+
+def conditional_headers(entry):
+    """Request headers that let the server answer 304 Not Modified for a cached @entry"""
+    headers = {}
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['lastModified']:
+            headers['If-Modified-Since'] = entry['lastModified']
+    return headers
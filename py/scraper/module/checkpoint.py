@@ -0,0 +1,35 @@
+"""
+Checkpoint of a crawl, saved after each level is written to the json lines files.
+It lists the finished levels and the size of the files after them,
+so that an interrupted crawl can resume with the next level.
+"""
+import os
+import json
+
+from utils import write
+from utils.pydir import datadir
+
+
+def checkpoint_path(subdir='raw'):
+    return os.path.join(datadir, subdir, 'checkpoint.json')
+
+
+def load(subdir='raw'):
+    """Returns the checkpoint of the interrupted crawl, or None"""
+    try:
+        with open(checkpoint_path(subdir)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save(checkpoint, subdir='raw'):
+    write.replace_json(checkpoint_path(subdir), checkpoint)
+
+
+def clear(subdir='raw'):
+    """Removes the checkpoint once the crawl is complete"""
+    try:
+        os.remove(checkpoint_path(subdir))
+    except FileNotFoundError:
+        pass
@@ -1,3 +1,5 @@
+from os import getenv, cpu_count
+
 default_container_id = 'content'
 base_url = 'https://edu.epfl.ch/'
 studyplan_path = '/studyplan/en/'
@@ -10,3 +12,36 @@ langs_dict = {
     'italien': 'Italian',
     'franglais': 'French and English'
 }
+
+headers = {'User-Agent': 'epfl-coursenet.herokuapp.com - valentin.loftsson@epfl.ch - Thank you!'}
+
+# maximum number of concurrent requests in total and per host (politeness limit)
+max_workers = int(getenv('SCRAPER_MAX_WORKERS', 8))
+max_per_host = int(getenv('SCRAPER_MAX_PER_HOST', 4))
+
+# number of parser processes, 0 parses in the main process (see pipeline.Pipeline)
+parse_workers = int(getenv('SCRAPER_PARSE_WORKERS', cpu_count() or 1))
+
+# delay before retrying a failed page in a resumed crawl, doubled on each failure up to the maximum (s)
+retry_delay = float(getenv('SCRAPER_RETRY_DELAY', 30))
+max_retry_delay = float(getenv('SCRAPER_MAX_RETRY_DELAY', 900))
+
+# fetch policy (see policy.py): timeouts (s), retries with exponential backoff (s),
+# requests per second per host, and failures in a row after which a host is left alone for a while (s)
+connect_timeout = float(getenv('SCRAPER_CONNECT_TIMEOUT', 10))
+read_timeout = float(getenv('SCRAPER_READ_TIMEOUT', 30))
+max_retries = int(getenv('SCRAPER_MAX_RETRIES', 3))
+backoff_base = float(getenv('SCRAPER_BACKOFF_BASE', 1))
+max_backoff = float(getenv('SCRAPER_MAX_BACKOFF', 60))
+rate_per_host = float(getenv('SCRAPER_RATE_PER_HOST', 10))
+breaker_threshold = int(getenv('SCRAPER_BREAKER_THRESHOLD', 10))
+breaker_cooldown = float(getenv('SCRAPER_BREAKER_COOLDOWN', 60))
+
+# replay crawls from the on-disk page cache without any network request
+offline = getenv('SCRAPER_OFFLINE', '0') == '1'
+
+# BeautifulSoup tree builder, e.g. 'lxml' (faster, needs the lxml package)
+html_parser = getenv('SCRAPER_HTML_PARSER', 'html.parser')
+
+# only build the tree of the containers the scrapers read (see util.ContainerStrainer)
+restricted_parse = getenv('SCRAPER_RESTRICTED_PARSE', '1') == '1'
@@ -3,7 +3,7 @@ from re import IGNORECASE
 from bs4 import NavigableString, Tag
 from urllib.parse import urlencode
 
-from scraper.module import util
+from scraper.module import util, fetch
 from scraper.module.const import base_url, coursebook_path, langs_dict
 
 regex_heading_element = re.compile('^h[1-6]$')
@@ -97,6 +97,14 @@ def scrape_coursebook_content(content, regx, tagname='h4'):
         return str_joined
 
 
+def url(source_slug, source_query_dict):
+    """Returns the URL of the course's coursebook page within the given program"""
+    querystring = urlencode(query=source_query_dict)
+    return util.join_path(
+        base_url, coursebook_path, f'{source_slug}?{querystring}'
+    )
+
+
 def scrape(source_slug, source_query_dict):
     """
     Scrapes info about given course from the coursebook page
@@ -104,16 +112,39 @@ def scrape(source_slug, source_query_dict):
     :param source_query_dict: query parameters identifying the program
     """
     print(f'>>> Scraping coursebook: {source_slug}')
-    querystring = urlencode(query=source_query_dict)
-    url = util.join_path(
-        base_url, coursebook_path, f'{source_slug}?{querystring}'
-    )
-    content, soup = util.bsoup(url, return_soup_object=True)
+    return parse(fetch.fetch(url(source_slug, source_query_dict)), source_query_dict)
 
-    course = {}
 
-    # could have provided program_id as parameter
+def parse(page, source_query_dict):
+    """
+    Parses info about a course from its coursebook @page
+    :param page: HTML of the coursebook page
+    :param source_query_dict: query parameters identifying the program
+    """
     program_id = util.program_html_id(source_query_dict)
+    return program_course(parse_page(page, [program_id]), source_query_dict)
+
+
+def program_course(parsed_page, source_query_dict):
+    """
+    Returns the course dict for the given program from a page parsed by parse_page
+    :param source_query_dict: query parameters identifying the program
+    """
+    program_id = util.program_html_id(source_query_dict)
+    return {
+        **parsed_page['programFields'].get(program_id, {}),
+        **parsed_page['course']
+    }
+
+
+def has_program(parsed_page, source_query_dict):
+    """Whether the program-specific fields of the program were found on the parsed page"""
+    return util.program_html_id(source_query_dict) in parsed_page['programFields']
+
+
+def scrape_program_fields(soup, program_id):
+    """Scrape the program-specific fields of the course (semester, exam form, ...)"""
+    fields = {}
     program_els = soup.find_all(id=program_id)
     for el in program_els:
         for li in el.find_next_sibling('ul').children:
@@ -124,18 +155,35 @@ def scrape(source_slug, source_query_dict):
             strong_text_split = strong_text.split(' ')
             key = util.camelCase(strong_text_split)
             val = li.text.strip().replace('\xa0', ' ')
-            if key in course and val != course[key]:
+            if key in fields and val != fields[key]:
                 if key == 'semester':
                     print('Both spring and fall semesters detected')
-                    course[key] = 'Any'
+                    fields[key] = 'Any'
                 else:
-                    print(f'Values for program {program_id} do not match: (1) {course[key]} (2) {val}')
-            elif key not in course:
-                course[key] = val
+                    print(f'Values for program {program_id} do not match: (1) {fields[key]} (2) {val}')
+            elif key not in fields:
+                fields[key] = val
+    return fields
+
+
+def parse_page(page, program_ids=()):
+    """
+    Parses a coursebook @page once for all the programs listed on it.
+    Returns the fields shared by all programs ('course') and the program-specific
+    fields of each listed program and of @program_ids, keyed by program HTML id ('programFields')
+    """
+    content, soup = util.make_soup(page, return_soup_object=True, keep_classes=['right-col'])
 
     in_the_programs_box = soup.find(class_='right-col').contents[0]
     underlined_divs = in_the_programs_box.find_all('div', class_='underline')
 
+    program_fields = {}
+    for program_id in [*program_ids, *(div.get('id') for div in underlined_divs)]:
+        if program_id is not None and program_id not in program_fields:
+            program_fields[program_id] = scrape_program_fields(soup, program_id)
+
+    course = {}
+
     # Save only ids and during post-processing replace the field with concrete data
     programs = []
     for div in underlined_divs:
@@ -197,7 +245,10 @@ def scrape(source_slug, source_query_dict):
     course['preparationFor'] = scrape_coursebook_content(
         content, regex_prerequisites)
 
-    return course
+    return {
+        'programFields': program_fields,
+        'course': course
+    }
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+"""
+Crawl state store (SQLite): status of each URL of the crawl (pending, done or failed),
+with its number of attempts, content hash and parsed result.
+A resumed crawl skips the pages that are done and retries the failed ones after a backoff delay.
+"""
+import os
+import json
+import time
+import sqlite3
+
+from utils.pydir import datadir
+from scraper.module.const import retry_delay, max_retry_delay
+
+schema = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    hash TEXT,
+    parsed TEXT,
+    error TEXT,
+    nextAttempt REAL
+)
+"""
+
+
+def state_path(subdir='raw'):
+    return os.path.join(datadir, subdir, 'crawl-state.sqlite')
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a URL that failed @attempts times"""
+    return min(retry_delay * 2 ** (attempts - 1), max_retry_delay)
+
+
+class CrawlState:
+    """
+    Status of the URLs of a crawl, stored in @subdir.
+    Unless @resume, the state of the previous crawl is cleared.
+    """
+    def __init__(self, subdir='raw', resume=False):
+        path = state_path(subdir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(schema)
+        if not resume:
+            self.db.execute('DELETE FROM urls')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def add(self, urls):
+        """Records @urls as pending, keeping the status of the URLs already known"""
+        self.db.executemany(
+            "INSERT OR IGNORE INTO urls (url, status) VALUES (?, 'pending')",
+            ((url,) for url in urls)
+        )
+        self.db.commit()
+
+    def completed(self, url):
+        """Returns (content hash, parsed result) if @url is done, otherwise None"""
+        row = self.db.execute(
+            "SELECT hash, parsed FROM urls WHERE url = ? AND status = 'done'", (url,)
+        ).fetchone()
+        return row and (row[0], json.loads(row[1]))
+
+    def done(self, url, key, result):
+        self.db.execute(
+            "UPDATE urls SET status = 'done', attempts = attempts + 1, hash = ?, parsed = ?, error = NULL "
+            "WHERE url = ?",
+            (key, json.dumps(result), url)
+        )
+        self.db.commit()
+
+    def failed(self, url, error):
+        (attempts,) = self.db.execute('SELECT attempts FROM urls WHERE url = ?', (url,)).fetchone()
+        self.db.execute(
+            "UPDATE urls SET status = 'failed', attempts = ?, error = ?, nextAttempt = ? WHERE url = ?",
+            (attempts + 1, repr(error), time.time() + backoff(attempts + 1), url)
+        )
+        self.db.commit()
+
+    def wait_for_retry(self, urls):
+        """Waits until the failed URLs among @urls may be retried"""
+        urls = set(urls)
+        next_attempts = [
+            next_attempt for url, next_attempt in
+            self.db.execute("SELECT url, nextAttempt FROM urls WHERE status = 'failed'")
+            if url in urls
+        ]
+        if next_attempts:
+            delay = max(next_attempts) - time.time()
+            if delay > 0:
+                print(f'>>> Retrying {len(next_attempts)} failed pages in {delay:.0f} s')
+                time.sleep(delay)
+
+    def summary(self):
+        """Number of URLs by status"""
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM urls GROUP BY status'))
@@ -0,0 +1,65 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scraper.module import cache, const, policy
+from scraper.module.const import headers, max_workers, max_per_host
+
+# one pooled session, so that connections are kept alive between requests
+session = requests.Session()
+session.headers.update(headers)
+adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+host_slots = {}
+host_slots_lock = threading.Lock()
+
+# number of pages fetched (200), revalidated (304) and replayed offline
+stats = {'fetched': 0, 'notModified': 0, 'offline': 0}
+stats_lock = threading.Lock()
+
+
+def count(key):
+    with stats_lock:
+        stats[key] += 1
+
+
+def host_slot(url):
+    """Returns the semaphore limiting concurrent requests to the host of @url"""
+    host = urlparse(url).netloc
+    with host_slots_lock:
+        if host not in host_slots:
+            host_slots[host] = threading.BoundedSemaphore(max_per_host)
+        return host_slots[host]
+
+
+def fetch(url):
+    """
+    Returns the body of the page at @url.
+    Cached pages are revalidated with a conditional request,
+    or returned as is in offline mode (const.offline).
+    Raises requests.HTTPError for error responses (see policy.get).
+    """
+    entry = cache.lookup(url)
+
+    if const.offline:
+        if entry is None:
+            raise LookupError(f'{url} is not in the page cache (offline mode)')
+        count('offline')
+        return entry['body']
+
+    with host_slot(url):
+        res = policy.get(session, url, headers=cache.conditional_headers(entry))
+
+    if res.status_code == 304 and entry is not None:
+        count('notModified')
+        return entry['body']
+
+    count('fetched')
+    if res.ok:
+        cache.store(url, res.text, res.headers.get('ETag'), res.headers.get('Last-Modified'))
+    return res.text
+
@@ -0,0 +1,50 @@
+"""
+Manifest of the pages parsed by the previous crawl, keyed by URL.
+Each entry stores a hash of the page content with its parsed result,
+so that an incremental crawl only parses the pages that changed (see pipeline.Pipeline).
+"""
+import os
+import json
+import hashlib
+
+from utils import write
+from utils.pydir import datadir
+
+def manifest_path(subdir='raw'):
+    return os.path.join(datadir, subdir, 'manifest.json')
+
+
+def load_manifest(subdir='raw'):
+    """Returns the manifest of the previous crawl written to @subdir, empty if there is none"""
+    try:
+        with open(manifest_path(subdir), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, subdir='raw'):
+    write.replace_json(manifest_path(subdir), manifest)
+
+
+def content_hash(page, args):
+    """Hash of @page and of the extra parse arguments @args"""
+    digest = hashlib.sha1(json.dumps(args, sort_keys=True).encode())
+    digest.update(page.encode())
+    return digest.hexdigest()
+
+
+def parse_json(parse_fn, page, *args):
+    """Returns parse_fn(@page, *@args) round tripped through json, so that it compares equal to the results of the manifest"""
+    return json.loads(json.dumps(parse_fn(page, *args)))
+
+
+def reusable(previous, url, key):
+    """Whether the @previous manifest holds the result parsed from @url with content hash @key"""
+    entry = previous.get(url)
+    return entry is not None and entry['hash'] == key
+
+
+def record(manifest, url, key, result):
+    """Records the @result parsed from @url in the @manifest of the next crawl"""
+    manifest[url] = {'hash': key, 'parsed': result}
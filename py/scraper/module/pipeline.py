@@ -0,0 +1,165 @@
+"""
+Crawl pipeline: fetcher threads put the raw pages on a queue,
+from which they are handed to a pool of parser processes.
+"""
+import time
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from scraper.module import const, fetch, incremental
+
+
+def configure(html_parser, restricted_parse):
+    """Initializes a parser process with the parse settings of the crawl"""
+    const.html_parser = html_parser
+    const.restricted_parse = restricted_parse
+
+
+def timed_parse(parse_fn, page, *args):
+    start = time.perf_counter()
+    result = incremental.parse_json(parse_fn, page, *args)
+    return result, time.perf_counter() - start
+
+
+class Pipeline:
+    """
+    Fetches and parses pages, parsing each page as soon as it is fetched.
+    Pages whose content hash matches the @previous manifest are not parsed again,
+    the results of all pages are recorded in @manifest (see incremental).
+    Pages that are done in the crawl @state are neither fetched nor parsed again (see crawlstate).
+    """
+    def __init__(self, previous, manifest, workers=None, state=None):
+        self.previous = previous
+        self.manifest = manifest
+        self.state = state
+        self.workers = const.parse_workers if workers is None else workers
+        self.pool = None
+        self.stats = {
+            'pages': 0,
+            'parsed': 0,
+            'reused': 0,
+            # pages done before the crawl was resumed
+            'completed': 0,
+            # time spent in the pipeline, and parsing summed over the parsers
+            'seconds': 0.0,
+            'parseSeconds': 0.0,
+            # number of fetched pages not parsed yet, sampled on each page
+            'maxQueueDepth': 0,
+            'sumQueueDepth': 0
+        }
+
+    def __enter__(self):
+        if self.workers > 0:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=configure,
+                initargs=(const.html_parser, const.restricted_parse)
+            )
+            # the parser processes are forked on the first task: start them now, before any fetcher thread
+            # exists, since a process forked while another thread holds a lock (connection pool, cache)
+            # could wait on it forever
+            self.pool.submit(configure, const.html_parser, const.restricted_parse).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def run(self, jobs):
+        """
+        Fetches and parses @jobs, a list of (url, parse_fn, args) where parse_fn(page, *args).
+        Returns (result, result of the previous crawl or None) for each job, in order.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        start = time.perf_counter()
+        pages = queue.Queue()
+        keys = [None] * len(jobs)
+        results = [None] * len(jobs)
+
+        pending = list(range(len(jobs)))
+        if self.state is not None:
+            urls = [url for url, _, _ in jobs]
+            self.state.add(urls)
+            self.state.wait_for_retry(urls)
+            pending = []
+            for i, url in enumerate(urls):
+                completed = self.state.completed(url)
+                if completed is None:
+                    pending.append(i)
+                else:
+                    keys[i], results[i] = completed
+                    self.stats['completed'] += 1
+
+        def fetch_job(i):
+            try:
+                pages.put((i, fetch.fetch(jobs[i][0]), None))
+            except Exception as err:
+                pages.put((i, None, err))
+
+        parses = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=min(const.max_workers, max(len(pending), 1))) as fetchers:
+            for i in pending:
+                fetchers.submit(fetch_job, i)
+
+            for _ in pending:
+                i, page, err = pages.get()
+                if err is not None:
+                    # finish the other pages first, so that a resumed crawl does not fetch them again
+                    errors[i] = err
+                    if self.state is not None:
+                        self.state.failed(jobs[i][0], err)
+                    continue
+
+                depth = pages.qsize() + sum(not parse.done() for parse in parses.values())
+                self.stats['maxQueueDepth'] = max(self.stats['maxQueueDepth'], depth)
+                self.stats['sumQueueDepth'] += depth
+                self.stats['pages'] += 1
+
+                url, parse_fn, args = jobs[i]
+                keys[i] = incremental.content_hash(page, args)
+                if incremental.reusable(self.previous, url, keys[i]):
+                    results[i] = self.previous[url]['parsed']
+                    self.stats['reused'] += 1
+                elif self.pool is not None:
+                    parses[i] = self.pool.submit(timed_parse, parse_fn, page, *args)
+                else:
+                    results[i], seconds = timed_parse(parse_fn, page, *args)
+                    self.stats['parsed'] += 1
+                    self.stats['parseSeconds'] += seconds
+
+        for i, future in parses.items():
+            results[i], seconds = future.result()
+            self.stats['parsed'] += 1
+            self.stats['parseSeconds'] += seconds
+
+        if self.state is not None:
+            for i in pending:
+                if i not in errors:
+                    self.state.done(jobs[i][0], keys[i], results[i])
+        if errors:
+            raise next(iter(errors.values()))
+
+        for (url, _, _), key, result in zip(jobs, keys, results):
+            incremental.record(self.manifest, url, key, result)
+
+        self.stats['seconds'] += time.perf_counter() - start
+        return [
+            (result, self.previous[url]['parsed'] if url in self.previous else None)
+            for (url, _, _), result in zip(jobs, results)
+        ]
+
+    def summary(self):
+        stats = self.stats
+        pages_per_second = stats['pages'] / stats['seconds'] if stats['seconds'] else 0
+        mean_depth = stats['sumQueueDepth'] / stats['pages'] if stats['pages'] else 0
+        return (
+            f"{stats['pages']} pages in {stats['seconds']:.1f} s ({pages_per_second:.1f} pages/s), "
+            f"{stats['parsed']} parsed by {self.workers or 'no'} parser processes "
+            f"in {stats['parseSeconds']:.1f} s, {stats['reused']} reused, {stats['completed']} done before resuming, "
+            f"queue depth {mean_depth:.1f} mean, {stats['maxQueueDepth']} max"
+        )
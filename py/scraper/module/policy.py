@@ -0,0 +1,190 @@
+"""
+Fetch policy: timeouts, retries with exponential backoff and jitter,
+a token-bucket rate limiter and a circuit breaker per host,
+and the latency, size and retries of each request.
+"""
+import time
+import random
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+
+from scraper.module.const import (
+    connect_timeout, read_timeout, max_retries, backoff_base, max_backoff,
+    rate_per_host, breaker_threshold, breaker_cooldown, max_per_host
+)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without sending the request while the circuit of a host is open"""
+
+
+# errors of requests that may succeed if sent again (connection lost, even while reading the body)
+retryable_errors = (
+    requests.ConnectionError, requests.Timeout,
+    requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError
+)
+
+
+class TokenBucket:
+    """Allows @rate requests per second on average, and bursts of @capacity requests"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until a token is available and takes it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after @threshold consecutive failures, so that requests fail fast for @cooldown seconds.
+    Then one request is let through: the circuit closes if it succeeds, and opens again otherwise.
+    """
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def check(self, host):
+        with self.lock:
+            if self.opened is None:
+                return
+            if self.trial or time.monotonic() - self.opened < self.cooldown:
+                raise CircuitOpenError(f'Circuit open for {host} after {self.failures} failures')
+            # half-open: let this request through
+            self.trial = True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+
+buckets = defaultdict(lambda: TokenBucket(rate_per_host, max_per_host))
+breakers = defaultdict(lambda: CircuitBreaker(breaker_threshold, breaker_cooldown))
+hosts_lock = threading.Lock()
+
+# one record per request: url, status, seconds waiting for responses (over all retries), bytes, retries
+records = []
+records_lock = threading.Lock()
+
+
+def host_policy(url):
+    host = urlparse(url).netloc
+    with hosts_lock:
+        return host, buckets[host], breakers[host]
+
+
+def backoff(retries):
+    """Delay before retry number @retries + 1: exponential, with full jitter"""
+    return random.uniform(0, min(max_backoff, backoff_base * 2 ** retries))
+
+
+def retry_after(res):
+    """Delay asked by the server in the Retry-After header (seconds only), or None"""
+    value = res.headers.get('Retry-After', '')
+    return min(float(value), max_backoff) if value.isdigit() else None
+
+
+def record(url, status, seconds, num_bytes, retries):
+    with records_lock:
+        records.append({
+            'url': url,
+            'status': status,
+            'seconds': seconds,
+            'bytes': num_bytes,
+            'retries': retries
+        })
+
+
+def get(session, url, **kwargs):
+    """
+    GET @url with the session, retrying connection errors, timeouts, 429 and 5xx responses
+    (other request errors, e.g. too many redirects, fail at once).
+    Raises requests.HTTPError for error responses, so that error pages are never parsed.
+    """
+    host, bucket, breaker = host_policy(url)
+    seconds = 0.0
+    retries = 0
+    while True:
+        try:
+            breaker.check(host)
+        except CircuitOpenError:
+            record(url, None, seconds, 0, retries)
+            raise
+        bucket.acquire()
+        start = time.perf_counter()
+        try:
+            res = session.get(url, timeout=(connect_timeout, read_timeout), **kwargs)
+        except requests.RequestException as err:
+            seconds += time.perf_counter() - start
+            # also ends the trial request of a half-open circuit
+            breaker.failure()
+            if retries >= max_retries or not isinstance(err, retryable_errors):
+                record(url, None, seconds, 0, retries)
+                raise
+            delay = backoff(retries)
+        else:
+            seconds += time.perf_counter() - start
+            if res.status_code != 429 and res.status_code < 500:
+                breaker.success()
+                record(url, res.status_code, seconds, len(res.content), retries)
+                res.raise_for_status()
+                return res
+
+            breaker.failure()
+            if retries >= max_retries:
+                record(url, res.status_code, seconds, len(res.content), retries)
+                res.raise_for_status()
+            delay = retry_after(res) or backoff(retries)
+
+        retries += 1
+        time.sleep(delay)
+
+
+def summary(num_slowest=10):
+    """Summary of the requests sent so far, with the slowest URLs"""
+    with records_lock:
+        done = list(records)
+    if not done:
+        return 'no requests'
+
+    seconds = sorted(r['seconds'] for r in done)
+    lines = [
+        f"{len(done)} requests, {sum(r['bytes'] for r in done) / 2**20:.1f} MiB, "
+        f"{sum(r['retries'] for r in done)} retries, "
+        f"{sum(r['status'] is None or r['status'] >= 400 for r in done)} failed, "
+        f"latency {seconds[len(seconds) // 2]:.2f} s median, "
+        f"{seconds[int(len(seconds) * 0.95)]:.2f} s p95, {seconds[-1]:.2f} s max",
+        'slowest:'
+    ]
+    for r in sorted(done, key=lambda r: r['seconds'], reverse=True)[:num_slowest]:
+        lines.append(f"  {r['seconds']:.2f} s {r['url']} ({r['status']}, {r['retries']} retries)")
+    return '\n'.join(lines)
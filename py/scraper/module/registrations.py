@@ -1,18 +1,26 @@
 import os
 import re
-import json
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup as bsoup
-import util
+
+from scraper.module import util, policy
+from scraper.module.const import headers, max_workers, connect_timeout, read_timeout
+from utils import write
 
 # https://isa.epfl.ch/imoniteur_ISAP/!GEDREPORTS.filter?ww_i_reportModel=2212045167
-ISA_BASE_URL = 'https://isa.epfl.ch/imoniteur_ISAP/'
+# (ISA_BASE_URL can point to a local fake ISA server for testing)
+ISA_BASE_URL = os.environ.get('ISA_BASE_URL', 'https://isa.epfl.ch/imoniteur_ISAP/')
 ISA_REPORT_MODEL = '2212045167'
 ISA_REPORTS_INSCRIPTIONS_COURS = '!GEDREPORTS.filter'
 ISA_COURSE_REPORT = '!GEDREPORTS.bhtml'
 ISA_LOGIN_ACTION = '!logins.tryToConnect'
 
-regex_years_end = re.compile('.+\d{4}.\d{4}$')
+regex_years_end = re.compile(r'.+\d{4}.\d{4}$')
+regex_number = re.compile(r'\d+')
+epfl_prefix = 'Ecole polytechnique fédérale de Lausanne, '
 
 
 def get_login_form():
@@ -47,130 +55,180 @@ def get_report_form(ww_x_MAT='', zz_x_PERIODE_ACAD='', ww_x_PERIODE_ACAD=''):
     }
 
 
-def process_course_registration_report(reg, soup):
-    # select elements with info about the number of students per program, year, semester
-    colspan_2 = soup.select('tr > td[colspan="2"]')
+def merge_semester(semesters, semester):
+    """
+    Adds the number of @semester to the @semesters of a program, in increasing order,
+    e.g. 'Master semester 1' and 'Master semester 3' --> 'Master semester 1, 3'
+    """
+    sem = semester.rsplit(maxsplit=1)[1]
+    oldsem = semesters.rsplit(maxsplit=1)[1]
+    try:
+        if int(sem) > int(oldsem):
+            return f'{semesters}, {sem}'  # append
+        return f'{semesters[:-1]}{sem}, {oldsem}'  # prepend
+    except ValueError:
+        return f'{semesters}, {sem}'
+
+
+def process_course_registration_report(reg, soup, programs_reg=None):
+    """
+    Adds the registrations of the report @soup to @reg, by year and programs.
+    Rows list programs (program, year, semester) followed by the number of students ('ét.')
+    of these programs together, counts are keyed by the programs joined with newlines.
+    The (program, semesters) pairs of each count are added to @programs_reg with the same keys,
+    since program names can contain ', ' too.
+    """
+    # semesters of the programs of the current count, by program (in order of appearance)
+    programs = {}
+    year = None
 
-    programs = []
-    semesters = []
-
-    for el in colspan_2:
+    # select elements with info about the number of students per program, year, semester
+    for el in soup.find_all('td', colspan='2'):
+        if el.parent.name != 'tr':
+            continue
         text = el.text
 
         if 'ét.' not in text:  # program name, year and semester info
-            text = text.replace('Ecole polytechnique fédérale de Lausanne, ', '')  # replace epfl prefix which occurs sometimes
+            text = text.replace(epfl_prefix, '')  # replace epfl prefix which occurs sometimes
 
             if regex_years_end.match(text):
                 # edoc (phd), no semester info
-                text_split = text.rsplit(', ', maxsplit=1)
-                program = text_split[0]
-                year = text_split[1]
+                program, year = text.rsplit(', ', maxsplit=1)
                 semester = ''
             else:
-                text_split = text.rsplit(', ', maxsplit=2)
-                program = text_split[0]
-                year = text_split[1]
-                semester = text_split[2]
+                program, year, semester = text.rsplit(', ', maxsplit=2)
 
             if year not in reg:
                 reg[year] = {}
 
-            if program in programs:
-                idx = programs.index(program)
-                if semesters[idx] == semester:
-                    continue  # continue if the semester info is the same
-
-                sem = semester.rsplit(maxsplit=1)[1]
-                oldsem = semesters[idx].rsplit(maxsplit=1)[1]
-
-                try:
-                    if int(sem) > int(oldsem):
-                        semesters[idx] += (', ' + sem)  # append
-                    else:
-                        semesters[idx] = semesters[idx][:-1]
-                        semesters[idx] += (sem + ', ' + oldsem)  # prepend
-                except ValueError:
-#                     print(course_name, program, year, sem)
-                    semesters[idx] += (', ' + sem)
-
-            else:
-                programs.append(program)
-                semesters.append(semester)
-
-#             if program not in reg:
-                # sometimes two master semesters in a row for the same program,
-                # so we only extract info from the first line
-                # For example:
+            semesters = programs.get(program)
+            if semesters is None:
+                programs[program] = semester
+            elif semesters != semester:
+                # sometimes several semesters in a row for the same program, for example:
                 # Bioengineering, 2019-2020, Master semester 3
                 # Bioengineering, 2019-2020, Master semester 1
-
-#                 level = ''
-#                 if 'edoc' in program.lower():
-#                     level = 'doctoral_school'
-#                 elif 'master' in semester.lower():
-#                     level = 'master'
-#                 elif 'bachelor' in semester.lower():
-#                     level = 'bachelor'
-#                 elif 'minor' in program.lower() or 'mineur' in program.lower():
-#                     level = 'minor'
-#                 else:
-#                     the program might be a UNIL program or exchange program, for instance
-
-#                 program_key = level + program
-#                 reg[year][program]['level'] = level
+                programs[program] = merge_semester(semesters, semester)
 
         else:
-#             reg[year][program]['count'] = re.search('\d+', text)[0]
             # we can't use lists as keys in a dictionary/json, but string - yes!
             programs_key = '\n'.join(
-                list(map(
-                    lambda tup: tup[0]+', '+tup[1] if tup[1] else tup[0],
-                    zip(programs, semesters)
-                ))
+                f'{program}, {semesters}' if semesters else program
+                for program, semesters in programs.items()
             )
-            reg[year][programs_key] = int(re.search('\d+', text)[0])
-            programs = []
-            semesters = []
-
-
-def scrape():
-    login_data = get_login_form()
-
-    # initialize
-    registrations_data = {}
-
-    with requests.Session() as session:
-        login_url = util.join_path(ISA_BASE_URL, ISA_LOGIN_ACTION)
-        session.post(login_url, data=login_data)
-
+            reg[year][programs_key] = int(regex_number.search(text)[0])
+            if programs_reg is not None:
+                programs_reg.setdefault(year, {})[programs_key] = list(programs.items())
+            programs = {}
+
+
+def login(workers):
+    """Returns a session logged into ISA, with a connection pool for @workers threads"""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    login_url = util.join_path(ISA_BASE_URL, ISA_LOGIN_ACTION)
+    res = session.post(login_url, data=get_login_form(), timeout=(connect_timeout, read_timeout))
+    res.raise_for_status()
+    return session
+
+
+def scrape_course_report(session, x_MAT):
+    """
+    Returns the registrations of the course @x_MAT by year and programs,
+    and the (program, semesters) pairs of each count with the same keys
+    """
+    course_report_url = util.join_path(ISA_BASE_URL, ISA_COURSE_REPORT)
+    response = policy.get(session, course_report_url, data=get_report_form(x_MAT))
+    reg = {}
+    programs_reg = {}
+    process_course_registration_report(reg, bsoup(response.text, 'html.parser'), programs_reg)
+    return reg, programs_reg
+
+
+def merge_registrations(registrations_data, course_name, reg):
+    """Merges the registrations @reg of a report into those of the course (course names are sometimes duplicated)"""
+    course = registrations_data.setdefault(course_name, {})
+    for year, counts in reg.items():
+        course.setdefault(year, {}).update(counts)
+
+
+def is_retryable(err):
+    """Whether a course report that failed with @err may succeed later (timeouts, connection and server errors)"""
+    response = getattr(err, 'response', None)
+    return response is None or response.status_code >= 500
+
+
+def scrape(workers=max_workers, retry_rounds=2, subdir='raw'):
+    """
+    Scrapes the registrations of all courses, sharing one logged in session between @workers threads.
+    Each course report is appended to data/@subdir/registrations.jsonl once scraped,
+    with the (program, semesters) pairs of its counts ('programs'),
+    reports that timed out or failed with a server error are retried @retry_rounds times after the others,
+    other failed reports (e.g. 404) are recorded by course and skipped.
+    Returns the registrations by course name, year and programs.
+    """
+    # registrations of each course report, by course id
+    reports = {}
+    # (course name, error) of each course report that could not be scraped, by course id
+    failed = {}
+
+    with login(workers) as session:
         report_url = util.join_path(ISA_BASE_URL, ISA_REPORTS_INSCRIPTIONS_COURS)
-        report_data = get_report_form()
-        response = session.get(report_url, data=report_data)
+        response = policy.get(session, report_url, data=get_report_form())
         soup = bsoup(response.text, 'html.parser')
 
         # get all ids and course names below
         # "Cliquez sur une des matières pour avoir les inscriptions"
         ww_x_MAT = [(link.get('onclick')[32:-42], link.text.strip()) for link in soup.find_all(class_='ww_x_MAT')]
-        ww_x_MAT_timeouts = []
+        print(f'>>> Scraping the registrations of {len(ww_x_MAT)} course reports')
+        pending = ww_x_MAT
 
-        course_report_url = util.join_path(ISA_BASE_URL, ISA_COURSE_REPORT)
-
-        # loop over course ids and names
-        for x_MAT, course_name in ww_x_MAT:
+        def scrape_report(course):
             try:
-                print(f"scraping {x_MAT}: {course_name}")
-                report_data = get_report_form(x_MAT)
-                response = session.get(course_report_url, data=report_data, timeout=30)
-                soup = bsoup(response.text, 'html.parser')
-                print(soup.prettify())
-                if course_name not in registrations_data:
-                    # sometimes the course name is duplicated
-                    registrations_data[course_name] = {}
-
-                get_isa_course_report(registrations_data[course_name], soup)
-            except requests.exceptions.Timeout:
-                ww_x_MAT_timeouts.append((x_MAT, course_name))
-                continue
+                return scrape_course_report(session, course[0])
+            except requests.exceptions.RequestException as err:
+                return err
+
+        with write.open_jsonl('registrations', subdir) as jsonl_file, ThreadPoolExecutor(max_workers=workers) as executor:
+            for round_num in range(retry_rounds + 1):
+                ww_x_MAT_timeouts = []
+
+                for (x_MAT, course_name), report in zip(pending, executor.map(scrape_report, pending)):
+                    if isinstance(report, Exception):
+                        failed[x_MAT] = (course_name, report)
+                        if is_retryable(report):
+                            ww_x_MAT_timeouts.append((x_MAT, course_name))
+                        continue
+                    failed.pop(x_MAT, None)
+                    print(f"scraped {x_MAT}: {course_name}")
+                    reg, programs_reg = report
+                    reports[x_MAT] = reg
+                    write.write_records(
+                        jsonl_file,
+                        [{'id': x_MAT, 'name': course_name, 'registrations': reg, 'programs': programs_reg}]
+                    )
+
+                if not ww_x_MAT_timeouts:
+                    break
+                print(f'>>> {len(ww_x_MAT_timeouts)} course reports timed out or failed (round {round_num + 1})')
+                pending = ww_x_MAT_timeouts
+
+    if failed:
+        print(f'>>> Giving up on {len(failed)} course reports:')
+        for x_MAT, (course_name, err) in failed.items():
+            print(f'{x_MAT}: {course_name}: {type(err).__name__}: {err}')
+    print(f'>>> {policy.summary()}')
+
+    # merge the reports in the order of the courses, whatever the order they were scraped in
+    registrations_data = {}
+    for x_MAT, course_name in ww_x_MAT:
+        if x_MAT in reports:
+            merge_registrations(registrations_data, course_name, reports[x_MAT])
+    return registrations_data
 
 
 if __name__ == '__main__':
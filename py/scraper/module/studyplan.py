@@ -6,7 +6,7 @@ from titlecase import titlecase
 from urllib.parse import urlparse, parse_qs, parse_qsl
 from bs4 import NavigableString, Tag
 
-from scraper.module import util
+from scraper.module import util, fetch
 from scraper.module.const import base_url, studyplan_path, langs_dict
 
 regex_specializations = re.compile('Specialization|Orientation', re.IGNORECASE)
@@ -217,13 +217,42 @@ electrical_electronics_engineering_specs_values = {
     }
 }
 
+# classes of the columns of a studyplan line
+line_columns = {
+    'cours-code', 'cours-name', 'section-name', 'langue',
+    'enseignement-name', 'examen', 'credit-time', 'specialisation'
+}
+
+
+def line_columns_dict(line):
+    """
+    Returns the first tag of each column class of @line, found in a single traversal
+    ('langue' is the language span nested in the 'langue' column)
+    """
+    columns = {}
+    language_column = None
+    for tag in line.find_all(True):
+        for cls in tag.get('class') or ():
+            if cls not in line_columns:
+                continue
+            if cls == 'langue' and language_column is None:
+                language_column = tag
+            elif cls == 'langue':
+                if 'langue' not in columns and any(p is language_column for p in tag.parents):
+                    columns['langue'] = tag
+            elif cls not in columns:
+                columns[cls] = tag
+    return columns
+
+
 def filter_lines(lines):
     for line in lines:
-        code = line.find(class_='cours-code').text.strip()
+        columns = line_columns_dict(line)
+        code = columns['cours-code'].text.strip()
         # Exclude ETH courses, for example Nuclear Eng. joint master studyplan
         # See joint/dobule degrees: https://www.epfl.ch/education/master/double-degrees/
         if code and not code.startswith('ETH'):
-            yield (line, code)
+            yield (columns, code)
 
 
 def scrape_studyplan_specializations(soup):
@@ -261,8 +290,8 @@ def construct_course_slug(course_code):
     return regex_code_parens.sub('-\g<1>', course_code).lower()
 
 
-def scrape_lecturers(line_tag):
-    enseignement_name = line_tag.find(class_='enseignement-name')
+def scrape_lecturers(columns):
+    enseignement_name = columns['enseignement-name']
     lecturers = []
     for child in enseignement_name.children:
         if isinstance(child, NavigableString) and child.strip():
@@ -283,29 +312,40 @@ def scrape_lecturers(line_tag):
     return lecturers
 
 
-def scrape_course_specs_generator(line, specs_dict):
-    for img in line.find(class_='specialisation').find_all('img'):
+def scrape_course_specs_generator(columns, specs_dict):
+    for img in columns['specialisation'].find_all('img'):
         spec_value = img.get('src')[-5:-4]
         try:
             matched_spec = next(spec_dict for key, spec_dict in specs_dict.items() if spec_value == key)
             yield matched_spec
         except StopIteration:
-            course_code = line.find(class_="cours-code").string.strip()
+            course_code = columns['cours-code'].string.strip()
             print(f'Specialization "{spec_value}" not found in specialization legend [{course_code}]')
 
 
-def scrape(program):#(level_source_slug, program_source_slug, program_slug):
+def url(program):
+    """Returns the URL of the program's studyplan page"""
+    return util.join_path(base_url, studyplan_path, program['levelSourceSlug'], program['sourceSlug'])
+
+
+def scrape(program):
     """
     Scrapes studyplan data for the given level and program.
     Returns metadata for the program and the list of courses.
     """
+    return parse(fetch.fetch(url(program)), program)
+
+
+def parse(page, program):
+    """
+    Parses the studyplan @page of the given level and program.
+    Returns metadata for the program and the list of courses.
+    """
     level_source_slug = program['levelSourceSlug']
     program_source_slug = program['sourceSlug']
     print(f'\n>>> Scraping studyplan {level_source_slug}: {program_source_slug}\n')
 
-    # visit program's studyplan and fetch content soup
-    url = util.join_path(base_url, studyplan_path, level_source_slug, program_source_slug)
-    content, soup = util.bsoup(url, return_soup_object=True)
+    content, soup = util.make_soup(page, return_soup_object=True, keep_classes=['right-col'])
 
     program_data = {}
     courses_data = []
@@ -316,12 +356,12 @@ def scrape(program):#(level_source_slug, program_source_slug, program_slug):
 
     lines_and_codes = list(filter_lines(all_lines))
 
-    # extract course codes and create generator for lines
+    # extract course codes and the columns of each line
     lines = [t[0] for t in lines_and_codes]
     codes = [t[1] for t in lines_and_codes]
 
     # extract more relevant information from studyplan page
-    cours_name = [line.find(class_='cours-name') for line in lines]
+    cours_name = [line['cours-name'] for line in lines]
 
     # parse query string for coursebook pages (it's the same for all courses in a program)
     # and create the id that locates program information on each coursebook page
@@ -342,7 +382,7 @@ def scrape(program):#(level_source_slug, program_source_slug, program_slug):
     ]
     sections = [
         (
-            line.find(class_='section-name')
+            line['section-name']
             .text
             .strip()
             # PH_NE (nuclear engineering) --> PH
@@ -352,20 +392,20 @@ def scrape(program):#(level_source_slug, program_source_slug, program_slug):
     ]
     lang = [
         langs_dict[
-            line.find(class_='langue').find(class_='langue').get('class')[1]
+            line['langue'].get('class')[1]
         ]
         for line in lines
     ]
     lecturers = [scrape_lecturers(line) for line in lines]
     exam_form = [
-        line.find(class_='examen').text.strip()
-        if line.find(class_='examen')
+        line['examen'].text.strip()
+        if 'examen' in line
         else ''
         for line in lines
     ]
     credits = [
-        line.find(class_='credit-time').text.strip()
-        if line.find(class_='credit-time')
+        line['credit-time'].text.strip()
+        if 'credit-time' in line
         else ''
         for line in lines
     ]
@@ -1,23 +1,57 @@
 import re
-from requests import get
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
+from scraper.module import const, fetch
 from scraper.module.const import default_container_id
 
-headers = {'User-Agent': 'epfl-coursenet.herokuapp.com - valentin.loftsson@epfl.ch - Thank you!'}
 
 def join_path(*paths):
     return '/'.join(s.strip('/') for s in paths)
 
 
-def bsoup(
-    url,
+class ContainerStrainer(SoupStrainer):
+    """
+    Keeps only the subtrees of the tags with id @container_id or with one of @classes,
+    the rest of the page is tokenized but never built into a tree
+    """
+    def __init__(self, container_id, classes=()):
+        super().__init__()
+        self.container_id = container_id
+        self.classes = set(classes)
+
+    def keep(self, attrs):
+        if attrs.get('id') == self.container_id:
+            return True
+        classes = attrs.get('class') or ()
+        if isinstance(classes, str):
+            classes = classes.split()
+        return not self.classes.isdisjoint(classes)
+
+    # called by beautifulsoup4 < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        return self.keep(markup_attrs or {})
+
+    # called by beautifulsoup4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.keep(attrs or {})
+
+
+def make_soup(
+    text,
     return_container=True,
     return_soup_object=False,
-    container_id=default_container_id
+    container_id=default_container_id,
+    keep_classes=()
 ):
-    res = get(url, headers=headers)
-    soup = BeautifulSoup(res.text, 'html.parser')
+    """
+    Parses the page @text. The soup returned along with the container
+    only holds the container and the tags with one of @keep_classes (const.restricted_parse)
+    """
+    parse_only = None
+    if return_container and const.restricted_parse:
+        parse_only = ContainerStrainer(container_id, keep_classes)
+
+    soup = BeautifulSoup(text, const.html_parser, parse_only=parse_only)
 
     if return_container:
         if return_soup_object:
@@ -31,6 +65,10 @@ def bsoup(
     return soup
 
 
+def bsoup(url, **kwargs):
+    return make_soup(fetch.fetch(url), **kwargs)
+
+
 def camelCase(list_str):
     pascal_cased = ''.join([s.lower().capitalize() for s in list_str])
     camel_cased = pascal_cased[0].lower() + pascal_cased[1:]
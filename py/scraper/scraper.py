@@ -1,36 +1,182 @@
-from scraper.module import levels, programs, studyplan, coursebook
+from scraper.module import levels, programs, studyplan, coursebook, checkpoint, crawlstate, fetch, incremental, pipeline, policy, util
+from utils import write
 
-def scrape():
-    programs_info = levels.scrape()
-    courses_studyplan = []
-    courses_coursebook = []
+# json lines files the records are streamed to, level by level
+output_files = ['programs', 'courses-studyplan', 'courses-coursebook']
 
-    for level in programs_info:
-        programs_list = programs.scrape(level)
 
-        for program in programs_list:
-            program_extra, courses_list = studyplan.scrape(program)
+def scrape(incremental_crawl=False, resume=False, subdir='raw'):
+    """
+    Scrapes all programs and their courses, and appends them to the json lines files
+    programs (one level per line), courses-studyplan and courses-coursebook in @subdir.
+    With @incremental_crawl, only the pages that changed since the previous crawl are parsed.
+    With @resume, an interrupted crawl continues after the last level it wrote,
+    without fetching again the pages it parsed and retrying the pages that failed.
+    Returns the slugs of the programs and courses that changed ('programs', 'courses').
+    """
+    state = checkpoint.load(subdir) if resume else None
+    if state is None:
+        state = {
+            'levels': [],
+            'offsets': {filename: 0 for filename in output_files},
+            # pages parsed by the finished levels, and coursebook page of each source slug
+            'urls': [],
+            'coursebookUrls': {},
+            'changedPages': [],
+            'changes': {'programs': [], 'courses': []}
+        }
 
-            # update dict to maintain reference
-            program |= program_extra
+    saved = incremental.load_manifest(subdir) if incremental_crawl or state['urls'] else {}
+    # pages parsed by the previous crawl, by url (a full crawl parses everything again)
+    previous = saved if incremental_crawl else {}
+    manifest = {url: saved[url] for url in state['urls']}
+    changes = state['changes']
 
-            courses_studyplan.extend(courses_list)
+    # coursebook pages parsed so far, by course source slug
+    # (a page lists the program-specific fields of all programs of the course)
+    coursebook_urls = state['coursebookUrls']
+    coursebook_pages = {
+        source_slug: manifest[url]['parsed'] for source_slug, url in coursebook_urls.items()
+    }
+    # source slugs of the coursebook pages that changed since the previous crawl
+    changed_pages = set(state['changedPages'])
+    num_coursebook_fetches = 0
+    num_coursebook_courses = 0
 
-            print(f'>>> Scraping studyplan coursebooks...\n')
+    files = {
+        filename: write.open_jsonl(filename, subdir, state['offsets'][filename])
+        for filename in output_files
+    }
+
+    # status of each url of the crawl
+    crawl_state = crawlstate.CrawlState(subdir, resume)
+
+    with pipeline.Pipeline(previous, manifest, state=crawl_state) as pipe:
+        for level in levels.scrape():
+            if level['slug'] in state['levels']:
+                print(f">>> Skipping level {level['slug']}, written by the interrupted crawl")
+                continue
 
-            for course in courses_list:
-                if course['sourceSlug'] is not None:
-                    course_dict = coursebook.scrape(
-                        course['sourceSlug'],
-                        program['sourceQuery']
+            programs_list = programs.scrape(level)
+            courses_studyplan = []
+            courses_coursebook = []
+
+            # fetch and parse the studyplans of the level,
+            # results are returned in the order of the programs
+            studyplans = pipe.run(
+                (studyplan.url(program), studyplan.parse, (program,))
+                for program in programs_list
+            )
+
+            courses_linked = []
+            for program, (result, previous_result) in zip(programs_list, studyplans):
+                program_extra, courses_list = result
+                if result != previous_result:
+                    changes['programs'].append(f"{level['slug']}/{program['slug']}")
+                    previous_courses = {c['slug']: c for c in previous_result[1]} if previous_result else {}
+                    changes['courses'].extend(
+                        c['slug'] for c in courses_list if previous_courses.get(c['slug']) != c
                     )
+
+                # update dict to maintain reference
+                program |= program_extra
+
+                courses_studyplan.extend(courses_list)
+                courses_linked.append([c for c in courses_list if c['sourceSlug'] is not None])
+
+            print(f'>>> Scraping studyplan coursebooks...\n')
+
+            # fetch each coursebook page only once over all programs,
+            # with the query of the first program that lists the course
+            jobs = {}
+            for program, linked in zip(programs_list, courses_linked):
+                program_id = util.program_html_id(program['sourceQuery'])
+                for course in linked:
+                    source_slug = course['sourceSlug']
+                    if source_slug not in coursebook_pages and source_slug not in jobs:
+                        url = coursebook.url(source_slug, program['sourceQuery'])
+                        jobs[source_slug] = (url, coursebook.parse_page, ([program_id],))
+
+            for source_slug, (result, previous_result) in zip(jobs, pipe.run(jobs.values())):
+                print(f'>>> Scraping coursebook: {source_slug}')
+                coursebook_pages[source_slug] = result
+                coursebook_urls[source_slug] = jobs[source_slug][0]
+                if result != previous_result:
+                    changed_pages.add(source_slug)
+
+            # pages that do not list a program are fetched again for it, by url
+            fallback_jobs = {}
+            for program, linked in zip(programs_list, courses_linked):
+                source_query = program['sourceQuery']
+                program_id = util.program_html_id(source_query)
+                for course in linked:
+                    source_slug = course['sourceSlug']
+                    if not coursebook.has_program(coursebook_pages[source_slug], source_query):
+                        url = coursebook.url(source_slug, source_query)
+                        fallback_jobs[url] = (url, coursebook.parse_page, ([program_id],))
+
+            program_pages = {}
+            changed_program_pages = set()
+            for url, (result, previous_result) in zip(fallback_jobs, pipe.run(fallback_jobs.values())):
+                program_pages[url] = result
+                if result != previous_result:
+                    changed_program_pages.add(url)
+
+            num_coursebook_fetches += len(jobs) + len(fallback_jobs)
+
+            for program, linked in zip(programs_list, courses_linked):
+                source_query = program['sourceQuery']
+                num_coursebook_courses += len(linked)
+
+                for course in linked:
+                    source_slug = course['sourceSlug']
+                    url = coursebook.url(source_slug, source_query)
+                    if url in program_pages:
+                        parsed_page = program_pages[url]
+                        changed = url in changed_program_pages
+                    else:
+                        parsed_page = coursebook_pages[source_slug]
+                        changed = source_slug in changed_pages
+
+                    course_dict = coursebook.program_course(parsed_page, source_query)
                     # add slug as a common identifier
                     # to course dict from studyplan page
                     # to facilitate merging
                     course_dict['slug'] = course['slug']
                     courses_coursebook.append(course_dict)
 
-        level['sourceCBCycle'] = program['sourceQuery']['cb_cycle']
-        level['programs'] = programs_list
+                    if changed:
+                        changes['courses'].append(course['slug'])
+
+            level['sourceCBCycle'] = program['sourceQuery']['cb_cycle']
+            level['programs'] = programs_list
+
+            write.write_records(files['programs'], [level])
+            write.write_records(files['courses-studyplan'], courses_studyplan)
+            write.write_records(files['courses-coursebook'], courses_coursebook)
+
+            state['levels'].append(level['slug'])
+            state['offsets'] = {filename: file.tell() for filename, file in files.items()}
+            state['urls'] = list(manifest)
+            state['changedPages'] = sorted(changed_pages)
+            incremental.save_manifest({**previous, **manifest}, subdir)
+            checkpoint.save(state, subdir)
+
+    for file in files.values():
+        file.close()
+
+    print(
+        f'>>> Fetched {num_coursebook_fetches} coursebook pages for {num_coursebook_courses} '
+        f'program courses ({num_coursebook_courses - num_coursebook_fetches} fetches saved)'
+    )
+    print(f'>>> Page cache: {fetch.stats}')
+    print(f'>>> Requests: {policy.summary()}')
+    print(f'>>> Pipeline: {pipe.summary()}')
+    print(f'>>> Crawl state: {crawl_state.summary()}')
+    crawl_state.close()
 
-    return programs_info, courses_studyplan, courses_coursebook
+    incremental.save_manifest(manifest, subdir)
+    checkpoint.clear(subdir)
+    changes['courses'] = list(dict.fromkeys(changes['courses']))
+    print(f">>> {len(changes['programs'])} programs and {len(changes['courses'])} courses changed")
+    return changes
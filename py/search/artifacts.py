@@ -0,0 +1,190 @@
+"""
+Read-only search artifacts that are memory-mapped instead of unpickled.
+
+Every array (vocabulary, IDF vector, stop words, CSR arrays of the features matrix and
+of its inverted index, course metadata columns) is stored as a .npy file and
+loaded with mmap_mode='r', so all search workers share the same pages of the
+OS page cache and start without deserializing anything
+(nor importing pandas, scikit-learn or nltk).
+
+Convert the existing pickle/npz files with:
+python search/artifacts.py
+"""
+import os
+import re
+import sys
+import json
+
+import numpy as np
+from scipy import sparse
+
+from utils.pydir import datadir
+from search import cleaning
+
+artifacts_dir = os.path.join(datadir, 'artifacts')
+metadata_filename = 'meta.json'
+# model files the artifacts are converted from
+source_files = ['tfidf.pickle', 'courses_df.pickle', 'features.npz']
+course_columns = ['slug', 'code', 'name', 'keywords']
+
+
+def artifact_path(name):
+    return os.path.join(artifacts_dir, f'{name}.npy')
+
+
+def exists():
+    """
+    Whether the artifacts were converted from the current model. Artifacts converted before
+    the stop words were saved, or before the model was saved again, are ignored until converted again
+    """
+    metadata_path = os.path.join(artifacts_dir, metadata_filename)
+    if not (os.path.exists(metadata_path) and os.path.exists(artifact_path('stopwords'))):
+        return False
+    # the metadata is written last
+    converted = os.path.getmtime(metadata_path)
+    newer = [
+        name for name in source_files
+        if os.path.exists(os.path.join(datadir, name)) and os.path.getmtime(os.path.join(datadir, name)) > converted
+    ]
+    if newer:
+        print(f"{', '.join(newer)} newer than the search artifacts, run python search/artifacts.py", file=sys.stderr)
+        return False
+    return True
+
+
+def save_array(name, array):
+    np.save(artifact_path(name), np.ascontiguousarray(array))
+
+
+def load_array(name):
+    return np.load(artifact_path(name), mmap_mode='r')
+
+
+def save_csr(name, mat):
+    mat = mat.copy()
+    mat.sort_indices()
+    save_array(f'{name}_data', mat.data)
+    save_array(f'{name}_indices', mat.indices)
+    save_array(f'{name}_indptr', mat.indptr)
+
+
+def load_csr(name, shape, matrix_class=sparse.csr_matrix):
+    arrays = (load_array(f'{name}_data'), load_array(f'{name}_indices'), load_array(f'{name}_indptr'))
+    return matrix_class(arrays, shape=shape, copy=False)
+
+
+def columns_from_df(courses_df):
+    """Course metadata columns as string arrays, indexed by doc id"""
+    return {
+        col: courses_df[col].fillna('').astype(str).to_numpy(dtype=str)
+        for col in course_columns
+    }
+
+
+class Vectorizer:
+    """
+    Query-side equivalent of the fitted TfidfVectorizer (word unigrams),
+    reading its vocabulary and IDF vector from memory-mapped arrays
+    """
+
+    def __init__(self, terms, term_ids, idf, stopwords, metadata):
+        # terms are sorted, term_ids[i] is the feature column of terms[i]
+        self.terms = terms
+        self.term_ids = term_ids
+        self.idf = idf
+        self.stopwords = frozenset(stopwords.tolist())
+        self.token_regex = re.compile(metadata['tokenPattern'])
+        self.sublinear_tf = metadata['sublinearTf']
+        self.norm = metadata['norm']
+
+    def clean(self, text):
+        """Cleans @text like the docs were cleaned (helpers.clean_text)"""
+        return cleaning.clean_text(text, self.stopwords)
+
+    def transform_one(self, text):
+        tokens = np.array(self.token_regex.findall(self.clean(text)))
+        if len(tokens) == 0:
+            return np.empty(0, dtype=self.term_ids.dtype), np.empty(0)
+
+        positions = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+        known = self.terms[positions] == tokens
+        ids, counts = np.unique(self.term_ids[positions[known]], return_counts=True)
+
+        weights = counts.astype(np.float64)
+        if self.sublinear_tf:
+            weights = np.log(weights) + 1
+        weights *= self.idf[ids]
+        if self.norm == 'l2' and len(weights):
+            weights /= np.sqrt(np.dot(weights, weights))
+        return ids, weights
+
+    def transform(self, texts):
+        rows = [self.transform_one(text) for text in texts]
+        indptr = np.cumsum([0] + [len(ids) for ids, _ in rows])
+        indices = np.concatenate([ids for ids, _ in rows]) if rows else []
+        data = np.concatenate([weights for _, weights in rows]) if rows else []
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(self.idf)))
+
+
+def convert():
+    """Writes the artifacts from the pickled vectorizer, dataframe and features"""
+    # only the conversion loads pickles (pandas) and the stop words (nltk)
+    from search import helpers, invindex
+
+    tfidf = helpers.load_pickle('tfidf')
+    courses_df = helpers.load_df('courses_df')
+    features = helpers.load_sparsemat('features').tocsr()
+
+    if tfidf.analyzer != 'word' or tfidf.ngram_range != (1, 1) or tfidf.stop_words:
+        raise ValueError('Only word unigram vectorizers without stop words are supported')
+    if not tfidf.use_idf or tfidf.binary:
+        raise ValueError('Only tf-idf weighting is supported')
+
+    os.makedirs(artifacts_dir, exist_ok=True)
+
+    vocabulary = sorted(tfidf.vocabulary_.items())
+    save_array('terms', np.array([term for term, _ in vocabulary], dtype=str))
+    save_array('term_ids', np.array([col for _, col in vocabulary], dtype=np.int32))
+    save_array('idf', tfidf.idf_)
+    save_array('stopwords', np.array(sorted(set(helpers.stopwords_en_fr)), dtype=str))
+
+    save_csr('features', features)
+    # CSC arrays of the features are the CSR arrays of their transpose
+    postings = invindex.build(features)
+    save_csr('inverted', postings.T.tocsr())
+    save_array('term_max', invindex.max_weights(postings))
+
+    for col, values in columns_from_df(courses_df).items():
+        save_array(f'course_{col}', values)
+
+    metadata = {
+        'shape': list(features.shape),
+        'tokenPattern': tfidf.token_pattern,
+        'sublinearTf': tfidf.sublinear_tf,
+        'norm': tfidf.norm
+    }
+    with open(os.path.join(artifacts_dir, metadata_filename), 'w') as file:
+        json.dump(metadata, file, indent=2)
+    print(f'Search artifacts written to {artifacts_dir}')
+
+
+def load():
+    """
+    Returns the model tuple expected by search.query:
+    (vectorizer, course columns, features, inverted index)
+    """
+    with open(os.path.join(artifacts_dir, metadata_filename)) as file:
+        metadata = json.load(file)
+    shape = tuple(metadata['shape'])
+
+    vectorizer = Vectorizer(
+        load_array('terms'), load_array('term_ids'), load_array('idf'), load_array('stopwords'), metadata
+    )
+    courses = {col: load_array(f'course_{col}') for col in course_columns}
+    features = load_csr('features', shape)
+    postings = load_csr('inverted', shape, sparse.csc_matrix)
+    return vectorizer, courses, features, (postings, load_array('term_max'))
+
+
+if __name__ == '__main__':
+    convert()
@@ -0,0 +1,19 @@
+"""
+Text cleaning of the docs and queries, without heavy imports so that
+the search process starts quickly from the artifacts.
+The stop words are passed in: nltk's list when preprocessing (see helpers),
+the list saved with the artifacts when searching.
+"""
+import re
+from string import punctuation
+
+duplicate_space_regex = re.compile(r'\s{2,}')
+
+
+def clean_text(text, stopwords):
+    # remove punctuation
+    text = "".join([ch if ch not in punctuation else ' ' for ch in text])
+    text = duplicate_space_regex.sub(' ', text)
+    text = text.strip().lower()
+    text = " ".join([w for w in text.split() if w not in stopwords])
+    return text
@@ -1,8 +1,7 @@
-import re
-from string import punctuation
 from os import path
 
 from utils.pydir import datadir
+from search import cleaning
 
 from scipy import sparse
 import pickle
@@ -22,14 +21,8 @@ def picklefile(filename):
     return datadir_join(f'{filename}.pickle')
 
 
-duplicate_space_regex = re.compile(r'\s{2,}')
 def clean_text(text):
-    # remove punctuation
-    text = "".join([ch if ch not in punctuation else ' ' for ch in text])
-    text = duplicate_space_regex.sub(' ', text)
-    text = text.strip().lower()
-    text = " ".join([w for w in text.split() if w not in stopwords_en_fr])
-    return text
+    return cleaning.clean_text(text, stopwords_en_fr)
 
 
 
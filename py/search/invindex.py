@@ -0,0 +1,97 @@
+"""
+Inverted index over the course features: term --> posting list of (doc, weight).
+
+The index is the features matrix in CSC format, in which each column (term)
+is stored contiguously: the posting list of term t is
+indices[indptr[t]:indptr[t+1]] (doc ids) with data[indptr[t]:indptr[t+1]] (weights).
+
+Build it next to the features matrix with:
+python search/invindex.py
+"""
+import sys
+
+import numpy as np
+
+index_filename = 'inverted'
+
+
+def build(features):
+    postings = features.tocsc()
+    postings.sort_indices()
+    return postings
+
+
+def max_weights(postings):
+    """Highest weight of each term over all docs (upper bound of its contribution)"""
+    return postings.max(axis=0).toarray().ravel()
+
+
+def indexes(postings, features, term_max):
+    """
+    Whether the saved @postings were built from @features (with the highest weights @term_max):
+    same shape, and the same number of docs and highest weight for each term
+    """
+    return (
+        postings.shape == features.shape
+        and np.array_equal(postings.getnnz(axis=0), features.getnnz(axis=0))
+        and np.array_equal(max_weights(postings), term_max)
+    )
+
+
+def load(features):
+    """
+    Loads the inverted index, or builds it from @features if it was not saved
+    or was saved for another features matrix (e.g. before the model was fitted again)
+    """
+    from search import helpers
+    term_max = max_weights(features)
+    try:
+        postings = helpers.load_sparsemat(index_filename).tocsc()
+    except FileNotFoundError:
+        return build(features), term_max
+    if not indexes(postings, features, term_max):
+        print(f'{index_filename}.npz does not match the features, run python search/invindex.py', file=sys.stderr)
+        postings = build(features)
+    return postings, term_max
+
+
+def candidates(query_vector, index, threshold, prune=True):
+    """
+    Returns the sorted ids of the docs that can reach @threshold for the
+    single-row sparse @query_vector.
+
+    Only docs that share a term with the query can score above zero.
+    With @prune, MaxScore-style pruning also skips the posting lists of the
+    "non-essential" terms: the least important query terms whose upper bounds
+    together stay below @threshold. A doc that contains none of the
+    remaining terms cannot reach the threshold.
+    """
+    postings, term_max = index
+    terms = query_vector.indices
+    if prune:
+        upper_bounds = query_vector.data * term_max[terms]
+        order = np.argsort(upper_bounds, kind='stable')
+        # keep a small margin so rounding errors never prune a qualifying doc
+        cumulative = np.cumsum(upper_bounds[order])
+        num_nonessential = np.searchsorted(cumulative, threshold * (1 - 1e-9))
+        terms = terms[order[num_nonessential:]]
+
+    posting_lists = [
+        postings.indices[postings.indptr[t]:postings.indptr[t + 1]]
+        for t in terms
+    ]
+    if not posting_lists:
+        return np.empty(0, dtype=postings.indices.dtype)
+    return np.unique(np.concatenate(posting_lists))
+
+
+def score(query_vector, features, docs):
+    """Scores @docs exactly like the exhaustive product over all docs"""
+    return (query_vector @ features[docs].T).toarray().ravel()
+
+
+if __name__ == '__main__':
+    from search import helpers
+    features = helpers.load_sparsemat('features')
+    helpers.save_sparsemat(build(features), index_filename)
+    print(f'Inverted index written to {helpers.datadir_join(index_filename)}.npz')
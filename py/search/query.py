@@ -1,51 +1,153 @@
 import sys
-from operator import itemgetter
+import json
 
-# Note that the tf-idf functionality in sklearn.feature_extraction.text can produce
-# normalized vectors, in which case cosine_similarity is equivalent to linear_kernel, only slower.
-# https://scikit-learn.org/stable/modules/metrics.html#cosine-similarity
-from sklearn.metrics.pairwise import linear_kernel
+import numpy as np
 
-from search import helpers
+from search import invindex, artifacts
+from utils.serve import serve_lines
 
-if len(sys.argv) < 3:
-    raise ValueError('Some arguments are missing')
+def load_model():
+    """
+    Returns (vectorizer, course columns, features, inverted index).
+    Memory-mapped artifacts are used when they have been converted
+    (see search/artifacts.py), otherwise the pickled model is loaded.
+    """
+    if artifacts.exists():
+        return artifacts.load()
 
-tfidf = helpers.load_pickle('tfidf')
-courses_df = helpers.load_df('courses_df')
-features = helpers.load_sparsemat('features')
+    from search import helpers
+    tfidf = helpers.load_pickle('tfidf')
+    courses = artifacts.columns_from_df(helpers.load_df('courses_df'))
+    features = helpers.load_sparsemat('features')
+    index = invindex.load(features)
+    return tfidf, courses, features, index
 
-def search(query, tfidf, features, topk, threshold=0.1):
-    query_features = tfidf.transform([query])
-    cosine_similarities = linear_kernel(query_features, features).flatten()
-    related_docs_indices, cos_sim_sorted = zip(
-        *sorted(enumerate(cosine_similarities), key=itemgetter(1), reverse=True)
-    )
 
-    cutoff_index = 0
-    for i, cos_sim in enumerate(cos_sim_sorted):
-        if cos_sim < threshold or i == topk:
-            cutoff_index = i
-            break
-    doc_ids = related_docs_indices[:cutoff_index]
-    similarities = [int(round(s, 2) * 100) for s in cos_sim_sorted[:cutoff_index]]
-    return doc_ids, similarities
+def select_topk(scores, topk, threshold):
+    """
+    Returns the indices of the @topk highest @scores that reach @threshold,
+    in decreasing order of score (ties are ordered by index)
+    """
+    if topk <= 0:
+        return np.empty(0, dtype=np.intp)
 
+    candidates = np.flatnonzero(scores >= threshold)
+    if len(candidates) > topk:
+        candidate_scores = scores[candidates]
+        # score of the topk-th best candidate, found in linear time
+        kth = len(candidates) - topk
+        kth_score = np.partition(candidate_scores, kth)[kth]
+        above = candidates[candidate_scores > kth_score]
+        ties = candidates[candidate_scores == kth_score][:topk - len(above)]
+        candidates = np.concatenate([above, ties])
 
-topk = sys.argv[1]
-try:
-    topk = int(topk)
-except:
-    raise TypeError('topk query parameter should be an integer')
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
 
-query = ' '.join(sys.argv[2:])
-# preprocess query in the same way we preprocess docs
-query_clean = helpers.clean_text(query)
 
-ids, similarities = search(query_clean, tfidf, features, topk)
-result_df = courses_df.loc[list(ids), ['slug', 'code', 'name', 'keywords']]
-result_df.insert(0, "cosine_similarity", similarities, True)
+def search_batch(queries, tfidf, features, topk, threshold=0.1, index=None, prune=True):
+    """
+    Returns a list of (doc_ids, similarities) tuples, one per query.
+    Without @index, all @queries are scored against all courses with a single
+    sparse matrix product. With an inverted @index, each query only keeps
+    the candidate courses that share a term with it (see invindex.candidates),
+    and the union of the candidates of all queries is scored with a single product.
+    """
+    query_features = tfidf.transform(queries)
 
-output = result_df.to_json(orient='records')
+    if index is None or threshold <= 0:
+        # Note that the tf-idf functionality in sklearn.feature_extraction.text produces
+        # normalized vectors, so the dot product is the cosine similarity.
+        # https://scikit-learn.org/stable/modules/metrics.html#cosine-similarity
+        cosine_similarities = (query_features @ features.T).toarray()
+        ranked = []
+        for scores in cosine_similarities:
+            doc_ids = select_topk(scores, topk, threshold)
+            ranked.append((doc_ids, scores[doc_ids]))
+    else:
+        doc_lists = [invindex.candidates(query_vector, index, threshold, prune) for query_vector in query_features]
+        # score the candidates of all queries with a single sparse product
+        docs = np.unique(np.concatenate([np.empty(0, dtype=np.intp), *doc_lists]))
+        candidate_similarities = (query_features @ features[docs].T).toarray()
+        ranked = []
+        for query_docs, similarities in zip(doc_lists, candidate_similarities):
+            scores = similarities[np.searchsorted(docs, query_docs)]
+            # candidates are sorted, so ties are still ordered by doc id
+            top = select_topk(scores, topk, threshold)
+            ranked.append((query_docs[top], scores[top]))
 
-print(output)
+    return [
+        (doc_ids, [int(round(s, 2) * 100) for s in top_scores])
+        for doc_ids, top_scores in ranked
+    ]
+
+
+def search(query, tfidf, features, topk, threshold=0.1, index=None):
+    return search_batch([query], tfidf, features, topk, threshold, index)[0]
+
+
+def parse_topk(topk):
+    try:
+        return int(topk)
+    except (TypeError, ValueError):
+        raise TypeError('topk query parameter should be an integer')
+
+
+def clean_query(tfidf, query):
+    """Preprocesses @query in the same way as the docs"""
+    if isinstance(tfidf, artifacts.Vectorizer):
+        # stop words saved with the artifacts
+        return tfidf.clean(query)
+    from search import helpers
+    return helpers.clean_text(query)
+
+
+def run_queries(queries, topk, tfidf, courses, features, index=None):
+    """Returns the search results for each of @queries as a JSON string"""
+    # preprocess queries in the same way we preprocess docs
+    queries_clean = [clean_query(tfidf, query) for query in queries]
+
+    outputs = []
+    for ids, similarities in search_batch(queries_clean, tfidf, features, topk, index=index):
+        records = [
+            {
+                'cosine_similarity': similarity,
+                **{col: str(courses[col][i]) for col in artifacts.course_columns}
+            }
+            for i, similarity in zip(ids, similarities)
+        ]
+        outputs.append(json.dumps(records))
+    return outputs
+
+
+def run_query(query, topk, tfidf, courses, features, index=None):
+    """Returns the search results for @query as a JSON string"""
+    return run_queries([query], topk, tfidf, courses, features, index)[0]
+
+
+def serve(model, infile=sys.stdin, outfile=sys.stdout):
+    """
+    Answers search requests until @infile is closed.
+    Each request is a JSON object on its own line, e.g. {"query": "...", "topk": 10},
+    and each answer is written as a single line of JSON, in the same order.
+    A request with a list of "queries" is answered with a list of results.
+    """
+    def answer(request):
+        topk = parse_topk(request.get('topk', 10))
+        if 'queries' in request:
+            return '[' + ','.join(run_queries(request['queries'], topk, *model)) + ']'
+        return run_query(request['query'], topk, *model)
+
+    serve_lines(answer, infile, outfile)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == '--serve':
+        serve(load_model())
+    else:
+        if len(sys.argv) < 3:
+            raise ValueError('Some arguments are missing')
+
+        topk = parse_topk(sys.argv[1])
+        query = ' '.join(sys.argv[2:])
+        print(run_query(query, topk, *load_model()))
@@ -1,31 +1,90 @@
 import sys
+import json
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
-from numpy import nan
-from search import helpers
+from search import helpers, simstore
+from utils.serve import serve_lines
 
-stdin1, stdin2 = sys.stdin.readline().split('#')
 
-similarity_threshold = int(float(stdin1) * 100)
-slugs = stdin2.split(',')
+def load_index():
+    """Returns the course slugs (by row id) and a slug --> row id dict"""
+    index = helpers.load_df('index').to_numpy()
+    return index, {slug: i for i, slug in enumerate(index)}
 
-index = helpers.load_df('index')
 
-df = (
-    pd.DataFrame.sparse.from_spmatrix(
-        helpers.load_sparsemat(f'sim{similarity_threshold}'),
-        index=index.rename('source'),
-        columns=index.rename('target')
-    )
-    .astype(pd.SparseDtype('float', nan))
-)
+def load_similarities(similarity_threshold):
+    """Sparse matrix of the course pairs with a similarity of at least @similarity_threshold"""
+    return simstore.similarities_above(simstore.load(), similarity_threshold)
 
-# Filter out courses which don't match provided slugs
-boolean_index = index.isin(slugs).values
-df = df.loc[boolean_index, boolean_index]
 
-# pair row and column indices (ignores NaNs)
-df = df.stack().sparse.to_dense().rename('similarity').reset_index()
-df['id'] = df.source + '--' + df.target
+def find_simlinks(similarities, index, slug_ids, slugs):
+    """
+    Returns the links between the given @slugs in the sparse @similarities
+    matrix as a dataframe with columns source, target, similarity and id
+    """
+    # row ids of the requested courses, in index order (unknown slugs are ignored)
+    ids = np.array(sorted({slug_ids[s] for s in slugs if s in slug_ids}), dtype=np.intp)
 
-print(df.to_json(orient='records'))
+    submatrix = similarities[ids][:, ids]
+    submatrix.sort_indices()
+    # pair row and column indices of the stored similarities
+    triplets = submatrix.tocoo()
+
+    df = pd.DataFrame({
+        'source': index[ids[triplets.row]],
+        'target': index[ids[triplets.col]],
+        'similarity': triplets.data
+    })
+    df['id'] = df.source + '--' + df.target
+    return df
+
+
+def serve(infile=sys.stdin, outfile=sys.stdout, cache_size=32):
+    """
+    Answers simlinks requests until @infile is closed.
+    Each request is a JSON object on its own line, {"threshold": 0.3, "slugs": [...]},
+    and each answer is written as a single line of JSON, in the same order.
+    The request {"command": "stats"} is answered with the cache counters.
+
+    Similarity matrices are kept in an LRU cache keyed by the number of pairs
+    above the threshold, so thresholds that select the same pairs share an entry.
+    """
+    index, slug_ids = load_index()
+    store = simstore.load()
+
+    @lru_cache(maxsize=cache_size)
+    def similarities(num_pairs):
+        return simstore.first_pairs(store, num_pairs)
+
+    def cache_stats():
+        return similarities.cache_info()._asdict()
+
+    def answer(request):
+        if request.get('command') == 'stats':
+            return json.dumps(cache_stats())
+        threshold = float(request['threshold'])
+        misses = similarities.cache_info().misses
+        similarities_above = similarities(simstore.count_above(store, threshold))
+        if similarities.cache_info().misses > misses:
+            print(f'simlinks cache miss (threshold {threshold}): {cache_stats()}', file=sys.stderr)
+        df = find_simlinks(similarities_above, index, slug_ids, request['slugs'])
+        return df.to_json(orient='records')
+
+    serve_lines(answer, infile, outfile)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == '--serve':
+        serve()
+    else:
+        stdin1, stdin2 = sys.stdin.readline().split('#')
+
+        similarity_threshold = float(stdin1)
+        slugs = stdin2.split(',')
+
+        index, slug_ids = load_index()
+        df = find_simlinks(load_similarities(similarity_threshold), index, slug_ids, slugs)
+
+        print(df.to_json(orient='records'))
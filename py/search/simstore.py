@@ -0,0 +1,65 @@
+"""
+Single store of all course similarity pairs above the lowest supported
+threshold, sorted by decreasing score, so that any threshold is answered
+by taking a prefix of the pairs.
+
+Build it from the lowest-threshold similarity matrix with:
+python search/simstore.py
+"""
+import numpy as np
+from scipy import sparse
+
+from search import helpers
+
+# similarities are rounded to 2 decimals, pairs below 0.2 are not stored
+lowest_threshold = 0.2
+store_filename = 'simpairs'
+
+
+def build(similarities):
+    """Returns the (source, target, score) arrays of the pairs of @similarities, best first"""
+    pairs = similarities.tocoo()
+    # sort by decreasing score, then by (source, target) for a stable order
+    order = np.lexsort((pairs.col, pairs.row, -pairs.data))
+    return {
+        'source': pairs.row[order].astype(np.int32),
+        'target': pairs.col[order].astype(np.int32),
+        'score': pairs.data[order],
+        'shape': np.array(similarities.shape)
+    }
+
+
+def save(store):
+    np.savez(helpers.datadir_join(store_filename), **store)
+
+
+def load():
+    with np.load(helpers.datadir_join(f'{store_filename}.npz')) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def count_above(store, threshold):
+    """Number of pairs with a score of at least @threshold"""
+    if threshold < lowest_threshold:
+        raise ValueError(f'Similarity threshold must be at least {lowest_threshold}')
+    # scores are sorted in decreasing order
+    return int(np.searchsorted(-store['score'], -threshold, side='right'))
+
+
+def first_pairs(store, num_pairs):
+    """Sparse similarity matrix of the @num_pairs best pairs"""
+    return sparse.csr_matrix(
+        (store['score'][:num_pairs], (store['source'][:num_pairs], store['target'][:num_pairs])),
+        shape=tuple(store['shape'])
+    )
+
+
+def similarities_above(store, threshold):
+    """Sparse similarity matrix of the pairs with a score of at least @threshold"""
+    return first_pairs(store, count_above(store, threshold))
+
+
+if __name__ == '__main__':
+    similarity_threshold = int(lowest_threshold * 100)
+    save(build(helpers.load_sparsemat(f'sim{similarity_threshold}')))
+    print(f'Similarity store written to {helpers.datadir_join(store_filename)}.npz')
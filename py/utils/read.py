@@ -14,3 +14,21 @@ def read_json_raw(filename):
 
 def read_json_processed(filename):
     return read_json(filename, 'processed')
+
+
+def iter_jsonl(filename, subdir):
+    """Yields the records of the json lines file @filename one by one"""
+    path = os.path.join(datadir, subdir, f'{filename}.jsonl')
+    with open(path) as file:
+        for line in file:
+            # skip a last record cut short by an interrupted write
+            if line.endswith('\n'):
+                yield json.loads(line)
+
+
+def read_jsonl(filename, subdir):
+    return list(iter_jsonl(filename, subdir))
+
+
+def read_jsonl_raw(filename):
+    return read_jsonl(filename, 'raw')
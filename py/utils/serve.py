@@ -0,0 +1,20 @@
+import sys
+import json
+
+
+def serve_lines(answer, infile=sys.stdin, outfile=sys.stdout):
+    """
+    Answers the requests of @infile until it is closed, one JSON request per line.
+    @answer takes a parsed request and returns its answer as a JSON string,
+    which is written on its own line, in the order of the requests.
+    A request that fails is answered with {"error": "<exception>"}.
+    """
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            output = answer(json.loads(line))
+        except Exception as e:
+            output = json.dumps({'error': f'{type(e).__name__}: {e}'})
+        outfile.write(output + '\n')
+        outfile.flush()
@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 from utils.pydir import datadir
 
 def create_dirs(path):
@@ -26,3 +27,40 @@ def write_object(filename, obj, subdir='raw', indent=2):
 
 def write_object_raw(filename, obj):
     write_object(filename, obj, subdir='raw')
+
+
+def replace_json(path, obj):
+    """
+    Writes @obj to the json file @path through a temporary file,
+    so that readers see either the previous content or the new one, never a partial file
+    """
+    create_dirs(path)
+    # unique per thread, so that concurrent writers of the same path do not share it
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(obj, file)
+    os.replace(tmp_path, path)
+
+
+def jsonl_path(filename, subdir='raw'):
+    return os.path.join(datadir, subdir, f'{filename}.jsonl')
+
+
+def open_jsonl(filename, subdir='raw', offset=0):
+    """
+    Opens the json lines file @filename for appending records,
+    after truncating it to @offset bytes (0 starts a new file)
+    """
+    path = jsonl_path(filename, subdir)
+    create_dirs(path)
+    with open(path, 'a'):
+        pass
+    os.truncate(path, offset)
+    return open(path, 'a')
+
+
+def write_records(jsonl_file, records):
+    """Appends @records to the open @jsonl_file, one json object per line"""
+    for record in records:
+        jsonl_file.write(json.dumps(record) + '\n')
+    jsonl_file.flush()
@@ -0,0 +1,100 @@
+const { spawn } = require('child_process')
+const readline = require('readline')
+
+const {
+  PYWORKER_TIMEOUT: defaultTimeout = 30 * 1000
+} = process.env
+
+/**
+ * Long-lived python process that answers JSON requests line by line.
+ * The process is started lazily and restarted if it exits.
+ * Answers are matched to requests in the order they were sent.
+ */
+class PythonWorker {
+  /**
+   * @param {string} script - path to the python script
+   * @param {string[]} args - arguments that start the script in server mode
+   * @param {number} timeout - milliseconds to wait for an answer before restarting the process
+   */
+  constructor(script, args = ['--serve'], timeout = Number(defaultTimeout)) {
+    this.script = script
+    this.args = args
+    this.timeout = timeout
+    this.child = null
+    this.lines = null
+    this.pending = []
+  }
+
+  start() {
+    const child = spawn('python', [this.script, ...this.args])
+    child.stderr.pipe(process.stderr)
+
+    const lines = readline.createInterface({ input: child.stdout })
+    lines.on('line', (line) => {
+      // late output of a replaced process must not answer the requests of the next one
+      if (this.child !== child) {
+        return
+      }
+      const request = this.pending.shift()
+      if (!request) {
+        return
+      }
+      clearTimeout(request.timer)
+      try {
+        request.resolve(JSON.parse(line))
+      } catch (err) {
+        request.reject(err)
+      }
+    })
+
+    child.on('error', (err) => this.fail(child, err))
+    // writing to a process that exited (EPIPE)
+    child.stdin.on('error', (err) => this.fail(child, err))
+    child.on('exit', (code) => {
+      this.fail(child, new Error(`${this.script} exited with code ${code}`))
+    })
+
+    this.child = child
+    this.lines = lines
+    console.info(`Started ${this.script} worker`)
+  }
+
+  fail(child, err) {
+    if (this.child !== child) {
+      return
+    }
+    // the next request starts a fresh process, the output of this one is no longer read
+    this.child = null
+    this.lines.close()
+    this.lines = null
+    this.pending.splice(0).forEach(request => {
+      clearTimeout(request.timer)
+      request.reject(err)
+    })
+  }
+
+  /**
+   * Sends a request to the worker
+   *
+   * @param {Object} payload - request, serialized as a single line of JSON
+   * @returns {Promise<Object>} parsed answer
+   */
+  request(payload) {
+    if (!this.child) {
+      this.start()
+    }
+    const child = this.child
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        // answers are matched by order, so the pending requests
+        // of a process that does not answer are failed and the process is replaced
+        this.fail(child, new Error(`${this.script} did not answer within ${this.timeout} ms`))
+        child.kill()
+      }, this.timeout)
+      this.pending.push({ resolve, reject, timer })
+      child.stdin.write(JSON.stringify(payload) + '\n')
+    })
+  }
+}
+
+module.exports = PythonWorker
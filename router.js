@@ -1,6 +1,4 @@
 const { promisify } = require('util')
-const exec = promisify(require('child_process').exec)
-const { spawn } = require('child_process')
 
 const express = require('express')
 const redis = require('redis')
@@ -11,32 +9,86 @@ router.use(express.json())
 const {
   REDIS_URL_STAGING: REDIS_URL = 'redis://@localhost:6379'
 } = process.env;
-const client = redis.createClient({ url: REDIS_URL });
+// replies are buffers for commands called with a buffer key
+const client = redis.createClient({ url: REDIS_URL, detect_buffers: true });
 
 client.on('connect', () => console.log('Redis connected!'))
 client.on('error', console.error)
 
 const getAsync = promisify(client.get).bind(client)
+const hgetallAsync = promisify(client.hgetall).bind(client)
 
 const { catchErrors } = require('./utils')
+const PythonWorker = require('./pyworker')
+
+// keep the search model and similarity matrices loaded between requests
+const searchWorker = new PythonWorker('./py/search/query.py')
+const simlinksWorker = new PythonWorker('./py/search/simlinks.py')
+const enrollmentsWorker = new PythonWorker('./py/db/enrollments.py')
+
+// key of the version of the dataset to read, each version has its own key prefix (v{n}:)
+const VERSION_KEY = 'dataset_version'
+// similarity store of the simlinks worker, which keeps the pairs down to this score (simstore.lowest_threshold)
+const LOWEST_SIMLINKS_THRESHOLD = 0.2
 
 /**
- * Fetches data by key from redis cache
+ * Fetches data by key from redis cache, in the current version of the dataset
  *
  * @param {string} key - key under which data is stored
- * @returns {Object}
+ * @returns {Object} buffers of the stored fields (json, gzip, br, etag), or null
  */
 async function fromCache(key) {
-  const cached = await getAsync(key)
-  return JSON.parse(cached)
+  const version = await getAsync(VERSION_KEY)
+  // unversioned keys were written before versioning
+  const versionedKey = Buffer.from(version ? `v${version}:${key}` : key)
+  try {
+    return await hgetallAsync(versionedKey)
+  } catch (err) {
+    if (err.code !== 'WRONGTYPE') {
+      throw err
+    }
+    // data stored as a json string before compressed variants were stored
+    const json = await getAsync(versionedKey)
+    return json && { json }
+  }
+}
+
+/**
+ * Sends the stored json as is, in the best encoding accepted by the client,
+ * or 304 Not Modified if the client has the current version (If-None-Match)
+ *
+ * @param {Object} fields - buffers of the stored fields
+ */
+function sendCached(req, res, fields) {
+  const encoding = req.acceptsEncodings(['br', 'gzip'].filter(e => fields[e]).concat('identity'))
+  const encoded = encoding && encoding !== 'identity'
+  // also on 304 answers, so that caches keep one copy per encoding
+  res.set('Vary', 'Accept-Encoding')
+
+  if (fields.etag) {
+    // strong ETags must differ between the encodings of the same json, e.g. "<sha1>-gzip"
+    const etag = fields.etag.toString()
+    res.set('ETag', encoded ? `${etag.slice(0, -1)}-${encoding}"` : etag)
+    if (req.fresh) {
+      return res.status(304).end()
+    }
+  }
+
+  res.type('json')
+  if (encoded) {
+    // compression() leaves encoded responses as they are
+    res.set('Content-Encoding', encoding)
+    return res.send(fields[encoding])
+  }
+  return res.send(fields.json)
 }
 
 async function getNavigation(req, res, next) {
-  const value = await fromCache('nav')
-  if (!value) {
+  const fields = await fromCache('nav')
+  if (!fields) {
     return next()
   }
-  return res.json(value)
+  return sendCached(req, res, fields)
 }
 
 async function getEPFL(req, res, next) {
@@ -47,21 +99,21 @@ async function getEPFL(req, res, next) {
   } = req.params
 
   const redisKey = ['epfl', level, program, specialization].filter(s => s).join('_')
-  const value = await fromCache(redisKey)
-  if (!value) {
+  const fields = await fromCache(redisKey)
+  if (!fields) {
     return next()
   }
-  return res.json(value)
+  return sendCached(req, res, fields)
 }
 
 async function getCourse(req, res, next) {
   const { slug } = req.params
   const redisKey = `course_${slug}`
-  const value = await fromCache(redisKey)
-  if (!value) {
+  const fields = await fromCache(redisKey)
+  if (!fields) {
     return next()
   }
-  return res.json(value)
+  return sendCached(req, res, fields)
 }
 
 async function submitQuery(req, res, next) {
@@ -69,18 +121,15 @@ async function submitQuery(req, res, next) {
   if (!query) {
     return res.status(400).json({ error: 'Parameter <query> is missing' })
   }
-  const cmd = `python ./py/search/query.py ${topk} ${query}`
   console.log(query)
-  const { stdout, stderr } = await exec(cmd)
+  const result = await searchWorker.request({ query, topk })
 
-  console.log('stdout:', stdout)
-  console.error('stderr:', stderr)
-
-  if (stderr) {
-    return res.status(500).json({ error: stderr })
+  if (result.error) {
+    console.error('search error:', result.error)
+    return res.status(500).json({ error: result.error })
   }
 
-  return res.json(JSON.parse(stdout))
+  return res.json(result)
 }
 
 async function findSimlinks(req, res, next) {
@@ -90,19 +139,36 @@ async function findSimlinks(req, res, next) {
   if (!Array.isArray(slugs) || !threshold) {
     return res.status(400).json({ error: 'Invalid parameters' })
   }
+  // numeric strings are accepted, as the worker parses the threshold with float()
+  const minSimilarity = Number(threshold)
+  if (!Number.isFinite(minSimilarity) || minSimilarity < LOWEST_SIMLINKS_THRESHOLD || minSimilarity > 1) {
+    return res.status(400).json({ error: `Parameter <threshold> must be a number between ${LOWEST_SIMLINKS_THRESHOLD} and 1` })
+  }
+
+  const result = await simlinksWorker.request({ threshold: minSimilarity, slugs })
+
+  if (result.error) {
+    console.error('simlinks error:', result.error)
+    return res.status(500).json({ error: result.error })
+  }
 
-  const child = spawn('python', ['./py/search/simlinks.py'])
-  child.stderr.pipe(process.stderr)
+  return res.json(result)
+}
+
+async function getEnrollments(req, res, next) {
+  const { course, program } = req.query
+  if (!course === !program) {
+    return res.status(400).json({ error: 'Exactly one of the parameters <course> or <program> is required' })
+  }
 
-  child.stdin.write(`${threshold}#${slugs}`)
-  child.stdin.end()  // important to call end()!
+  const result = await enrollmentsWorker.request(course ? { course } : { program })
 
-  let data = ''
-  for await (const chunk of child.stdout) {
-    data += chunk
+  if (result.error) {
+    console.error('enrollments error:', result.error)
+    return res.status(500).json({ error: result.error })
   }
 
-  return res.json(JSON.parse(data))
+  return res.json(result)
 }
 
 router.get('/', (req, res) => {
@@ -118,6 +184,7 @@ router.get('/', (req, res) => {
       '/search?query=<query>&topk=10': 'Keyword search'
     },
     '/nav': 'Treeview navigation structure',
+    '/enrollments?course=<name>|program=<name>': 'Enrollment counts by year',
   })
 })
 router.get(
@@ -136,6 +203,10 @@ router.get(
   '/course/search',
   catchErrors(submitQuery)
 )
+router.get(
+  '/enrollments',
+  catchErrors(getEnrollments)
+)
 router.post(
   '/simlinks',
   catchErrors(findSimlinks)